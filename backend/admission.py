@@ -0,0 +1,223 @@
+import os
+import hmac
+import math
+import time
+import hashlib
+import asyncio
+from collections import OrderedDict
+import orjson
+from metrics import ADMISSION_DECISIONS, ADMISSION_IN_FLIGHT, ADMISSION_QUEUED
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, str(default)))
+
+# Token cost per request and max concurrent requests, for the routes that spend upstream quota.
+# Routes not listed here are not admission-controlled.
+ROUTE_COSTS = {
+    "/generate-summary": _env_float("ADMISSION_COST_SUMMARY", 10),  # Two LLM calls
+    "/search": _env_float("ADMISSION_COST_SEARCH", 2),  # Embedding + GraphQL
+}
+ROUTE_CONCURRENCY = {
+    "/generate-summary": int(_env_float("ADMISSION_CONCURRENCY_SUMMARY", 8)),
+    "/search": int(_env_float("ADMISSION_CONCURRENCY_SEARCH", 16)),
+}
+# Initial service-time guesses (seconds), refined with an EWMA of observed durations
+ROUTE_SERVICE_TIME = {"/generate-summary": 8.0, "/search": 1.0}
+
+CLIENT_RATE = _env_float("ADMISSION_CLIENT_RATE", 1.0)  # tokens/second
+CLIENT_BURST = _env_float("ADMISSION_CLIENT_BURST", 30)
+GLOBAL_RATE = _env_float("ADMISSION_GLOBAL_RATE", 20.0)
+GLOBAL_BURST = _env_float("ADMISSION_GLOBAL_BURST", 200)
+# Shed instead of queueing when the expected wait for a slot exceeds this (seconds)
+MAX_QUEUE_WAIT = _env_float("ADMISSION_MAX_QUEUE_WAIT", 2.0)
+# Proxies whose X-Forwarded-For entries are trusted. The client is the rightmost hop that is not
+# one of them, since a client can put anything at the left end of the list.
+TRUSTED_PROXIES = {
+    addr.strip() for addr in os.environ.get("ADMISSION_TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if addr.strip()
+}
+# Browser users reach the backend through the Streamlit server, which tags each session with an
+# X-Client-Id signed with this shared secret. Unsigned or badly signed ids are ignored.
+CLIENT_ID_SECRET = os.environ.get("CLIENT_ID_SECRET", "")
+MAX_CLIENT_ID_LENGTH = 64
+MAX_TRACKED_CLIENTS = 10000
+EWMA_ALPHA = 0.2
+
+
+def sign_client_id(client_id: str, secret: str = None) -> str:
+    secret = CLIENT_ID_SECRET if secret is None else secret
+    return hmac.new(secret.encode(), client_id.encode(), hashlib.sha256).hexdigest()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available (0 if they are now)."""
+        self._refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        if cost > self.capacity:
+            return math.inf
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        self.tokens -= cost
+
+    def refund(self, cost: float):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+
+class RouteGate:
+    """Concurrency cap for one route, with an estimate of how long a new arrival would queue."""
+
+    def __init__(self, route: str, limit: int, service_time: float):
+        self.route = route
+        self.limit = limit
+        self.in_flight = 0
+        self.queued = 0
+        self.service_time = service_time
+        self._slots = asyncio.Semaphore(limit)
+
+    def estimated_wait(self) -> float:
+        if self.in_flight < self.limit:
+            return 0.0
+        # Each freed slot admits one waiter; slots free up roughly every service_time / limit
+        return (self.queued + 1) * self.service_time / self.limit
+
+    async def acquire(self, timeout: float) -> bool:
+        self.queued += 1
+        ADMISSION_QUEUED.labels(self.route).set(self.queued)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.queued -= 1
+            ADMISSION_QUEUED.labels(self.route).set(self.queued)
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.labels(self.route).set(self.in_flight)
+        return True
+
+    def release(self, duration: float):
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.labels(self.route).set(self.in_flight)
+        self.service_time += EWMA_ALPHA * (duration - self.service_time)
+        self._slots.release()
+
+
+class AdmissionControlMiddleware:
+    """Rate-limits and load-sheds the expensive routes before they reach the app.
+
+    A request must fit in both its client's and the global token bucket (429 otherwise), then
+    get a concurrency slot for its route. If the expected wait for a slot exceeds
+    MAX_QUEUE_WAIT it is shed right away with a 503, instead of timing out later.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.client_buckets = OrderedDict()
+        self.gates = {}
+
+    def _client_id(self, scope) -> str:
+        """Forwarded client IP, else the frontend's signed session id, else the socket IP."""
+        client = scope.get("client")
+        peer = client[0] if client else "unknown"
+        headers = dict(scope.get("headers", []))
+
+        if peer in TRUSTED_PROXIES:
+            hops = [hop.strip() for hop in headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",")]
+            for hop in reversed(hops):
+                if hop and hop not in TRUSTED_PROXIES:
+                    return hop
+
+        session = headers.get(b"x-client-id", b"").decode("latin-1").strip()
+        signature = headers.get(b"x-client-signature", b"").decode("latin-1").strip()
+        if (CLIENT_ID_SECRET and session and len(session) <= MAX_CLIENT_ID_LENGTH
+                and hmac.compare_digest(signature, sign_client_id(session))):
+            return f"session:{session}"
+        return peer
+
+    def _client_bucket(self, client_id: str) -> TokenBucket:
+        bucket = self.client_buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(CLIENT_RATE, CLIENT_BURST)
+            self.client_buckets[client_id] = bucket
+            if len(self.client_buckets) > MAX_TRACKED_CLIENTS:
+                self.client_buckets.popitem(last=False)
+        else:
+            self.client_buckets.move_to_end(client_id)
+        return bucket
+
+    def _gate(self, route: str) -> RouteGate:
+        gate = self.gates.get(route)
+        if gate is None:
+            gate = RouteGate(route, ROUTE_CONCURRENCY[route], ROUTE_SERVICE_TIME[route])
+            self.gates[route] = gate
+        return gate
+
+    async def __call__(self, scope, receive, send):
+        route = scope.get("path") if scope["type"] == "http" else None
+        if route not in ROUTE_COSTS:
+            await self.app(scope, receive, send)
+            return
+
+        # 1. Rate limits: take tokens only if both buckets can afford the request
+        now = time.monotonic()
+        cost = ROUTE_COSTS[route]
+        client_bucket = self._client_bucket(self._client_id(scope))
+        wait = max(client_bucket.wait_time(cost, now), self.global_bucket.wait_time(cost, now))
+        if wait > 0:
+            ADMISSION_DECISIONS.labels(route, "rate_limited").inc()
+            await self._reject(send, 429, "Rate limit exceeded, slow down", wait)
+            return
+        client_bucket.take(cost)
+        self.global_bucket.take(cost)
+
+        # 2. Concurrency: shed early if the queue is already longer than the SLO allows
+        gate = self._gate(route)
+        expected_wait = gate.estimated_wait()
+        if expected_wait > MAX_QUEUE_WAIT:
+            ADMISSION_DECISIONS.labels(route, "shed_queue").inc()
+            self._refund(client_bucket, cost)
+            await self._reject(send, 503, "Server busy, try again shortly", expected_wait)
+            return
+        if not await gate.acquire(MAX_QUEUE_WAIT):
+            ADMISSION_DECISIONS.labels(route, "shed_timeout").inc()
+            self._refund(client_bucket, cost)
+            await self._reject(send, 503, "Server busy, try again shortly", gate.estimated_wait())
+            return
+
+        ADMISSION_DECISIONS.labels(route, "admitted").inc()
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.monotonic() - start)
+
+    def _refund(self, client_bucket: TokenBucket, cost: float):
+        # A shed request did no work, so it shouldn't count against the client's budget
+        client_bucket.refund(cost)
+        self.global_bucket.refund(cost)
+
+    async def _reject(self, send, status: int, detail: str, retry_after: float):
+        retry_after = 60 if math.isinf(retry_after) else max(1, math.ceil(retry_after))
+        body = orjson.dumps({"detail": detail})
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
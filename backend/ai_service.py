@@ -1,12 +1,18 @@
 import os
 import json
+import time
+import asyncio
 import toml
 from typing import List, Dict
 from pydantic import BaseModel, Field
-from langchain.chat_models import init_chat_model
-from langchain.agents import create_agent
-from langchain_community.embeddings import JinaEmbeddings
-from langchain_community.vectorstores import FAISS
+from index_store import IndexManager, IndexNotLoaded
+from metrics import (
+    EMBEDDING_SECONDS, FAISS_SEARCH_SECONDS,
+    LLM_TIME_TO_FIRST_TOKEN, LLM_TOKENS_PER_SECOND, LLM_DURATION_SECONDS,
+)
+
+# LangChain, langchain_community and FAISS are imported inside the functions that use them,
+# so importing this module (and booting the API) stays fast.
 
 # Try to load secrets if env var is missing
 try:
@@ -20,40 +26,90 @@ try:
 except Exception:
     pass
 
-# Initialize LLM using the new init_chat_model pattern from the docs
-summary_model = init_chat_model("gpt-4o-mini", temperature=0.85)
-critica_model = init_chat_model("gpt-5-nano", temperature=0)
+SUMMARY_MODEL_NAME = "gpt-4o-mini"
+CRITICA_MODEL_NAME = "gpt-5-nano"
+
+_summary_model = None
+_critica_model = None
+
+def get_summary_model():
+    global _summary_model
+    if _summary_model is None:
+        from langchain.chat_models import init_chat_model
+        # Initialize LLM using the new init_chat_model pattern from the docs
+        _summary_model = init_chat_model(SUMMARY_MODEL_NAME, temperature=0.85)
+    return _summary_model
+
+def get_critica_model():
+    global _critica_model
+    if _critica_model is None:
+        from langchain.chat_models import init_chat_model
+        _critica_model = init_chat_model(CRITICA_MODEL_NAME, temperature=0)
+    return _critica_model
+
+class VectorStoreNotReady(Exception):
+    """Raised when a search arrives before the vector store has finished loading."""
 
-_vector_store = None
+_embeddings = None
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        jina_key = os.environ.get("JINA_API_KEY")
+        if not jina_key:
+            raise RuntimeError("JINA_API_KEY not found in environment.")
+        from langchain_community.embeddings import JinaEmbeddings
+        _embeddings = JinaEmbeddings(
+            jina_api_key=jina_key, model_name="jina-embeddings-v2-base-en"
+        )
+    return _embeddings
+
+def _load_faiss(index_path: str):
+    from langchain_community.vectorstores import FAISS
+    return FAISS.load_local(index_path, get_embeddings(), allow_dangerous_deserialization=True)
+
+index_manager = IndexManager(_load_faiss)
 
 def get_vector_store():
-    global _vector_store
-    if _vector_store is None:
-        index_path = os.path.join(os.path.dirname(__file__), "vector_store")
-        if os.path.exists(index_path):
-            jina_key = os.environ.get("JINA_API_KEY")
-            if not jina_key:
-                print("❌ Error: JINA_API_KEY not found in environment.")
-                return None
-                
-            embeddings = JinaEmbeddings(
-                jina_api_key=jina_key, model_name="jina-embeddings-v2-base-en"
-            )
-            _vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-            print(f"✅ Vector store loaded with {_vector_store.index.ntotal} documents.")
-    return _vector_store
-
-async def search_knowledge_base(query: str, k: int = 4):
-    """Searches the vector store for relevant documents."""
-    vector_store = get_vector_store()
-    if not vector_store:
-        print("⚠️ Vector store not found or failed to load.")
-        return []
-    
+    """Loads the manifest's current index if none is live yet. Blocking, so call it from a worker thread."""
+    if index_manager.current is None:
+        index_manager.load()
+    current = index_manager.current
+    return current.store if current else None
+
+def vector_store_status():
+    return index_manager.status()
+
+async def embed_query(query: str):
+    """Embeds a search query. The Jina call is blocking, so it runs in a worker thread."""
     print(f"🔍 Embedding query: '{query}'")
-    docs = vector_store.similarity_search(query, k=k)
-    print(f"✅ Found {len(docs)} documents.")
-    return [{"content": d.page_content, "metadata": d.metadata} for d in docs]
+    with EMBEDDING_SECONDS.time():
+        return await asyncio.to_thread(get_embeddings().embed_query, query)
+
+async def search_knowledge_base(query: str, k: int = 4, vector=None):
+    """Searches the vector store for relevant documents.
+
+    Returns the matches and the index version that was searched.
+    Pass `vector` to reuse an embedding the caller already computed for `query`.
+    Raises VectorStoreNotReady instead of loading the index inline if the background warmup
+    has not finished yet. The search holds a lease on the index version it started with, so a
+    concurrent hot-swap never pulls the index out from under it.
+    """
+    if index_manager.current is None:
+        # Fail fast, before paying for an embedding
+        raise VectorStoreNotReady(vector_store_status()["status"])
+    if vector is None:
+        vector = await embed_query(query)
+
+    # Only lease once nothing can fail or be cancelled before the `with` releases it
+    try:
+        lease = index_manager.acquire()
+    except IndexNotLoaded as e:
+        raise VectorStoreNotReady(str(e))
+    with lease, FAISS_SEARCH_SECONDS.time():
+        docs = lease.store.similarity_search_by_vector(vector, k=k)
+    print(f"✅ Found {len(docs)} documents in index {lease.version}.")
+    return [{"content": d.page_content, "metadata": d.metadata} for d in docs], lease.version
 
 class EvaluationResponse(BaseModel):
     """Response schema for the evaluation."""
@@ -87,14 +143,19 @@ async def generate_location_summary_stream(location_name: str, location_type: st
     Here is the data you have:
     """
 
+    from langchain.agents import create_agent
+
     agent = create_agent(
-        model=summary_model,
+        model=get_summary_model(),
         system_prompt=system_prompt,
     )
     
     input_msg = f"Location Name: {location_name}\nLocation Type: {location_type}\nKnown Residents: {resident_str}"
     
     full_summary = ""
+    start = time.perf_counter()
+    first_token_at = None
+    chunks = 0
 
     async for event in agent.astream(
         {"messages": [{"role": "user", "content": input_msg}]},
@@ -103,9 +164,19 @@ async def generate_location_summary_stream(location_name: str, location_type: st
         message = event[0]
         # Relaxed check: if it has content, yield it.
         if hasattr(message, "content") and message.content:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                LLM_TIME_TO_FIRST_TOKEN.labels(SUMMARY_MODEL_NAME).observe(first_token_at - start)
+            chunks += 1
             content = message.content
             full_summary += content
             yield content
+
+    end = time.perf_counter()
+    LLM_DURATION_SECONDS.labels(SUMMARY_MODEL_NAME).observe(end - start)
+    # Chat APIs stream roughly one token per chunk
+    if first_token_at is not None and chunks > 1 and end > first_token_at:
+        LLM_TOKENS_PER_SECOND.labels(SUMMARY_MODEL_NAME).observe((chunks - 1) / (end - first_token_at))
     
     # After summary is done, run evaluation
     evaluation = await evaluate_summary(full_summary, residents)
@@ -127,7 +198,8 @@ async def evaluate_summary(summary: str, original_residents: List[Dict]):
     resident_names = [r['name'] for r in original_residents]
     
     # Use with_structured_output as it's the modern replacement for StructuredOutputParser
-    structured_llm = critica_model.with_structured_output(EvaluationResponse)
+    # include_raw keeps the raw message, whose usage metadata gives the output token count
+    structured_llm = get_critica_model().with_structured_output(EvaluationResponse, include_raw=True)
     
     prompt = f"""
     You are an objective evaluator. Your task is to check if the following AI-generated summary is factually consistent with the provided data.
@@ -141,7 +213,19 @@ async def evaluate_summary(summary: str, original_residents: List[Dict]):
     3. References to "Morty" or "Rick" as part of the narration style (e.g. "It's boring, Morty!") are allowed and should NOT be counted as factual errors.
     """
     
-    evaluation = await structured_llm.ainvoke(prompt)
-    
-    # with_structured_output returns the Pydantic object directly
-    return evaluation.model_dump()
+    start = time.perf_counter()
+    result = await structured_llm.ainvoke(prompt)
+    duration = time.perf_counter() - start
+
+    # Structured output isn't streamed, so the first token arrives with the whole response:
+    # TTFT equals the duration, and tokens/sec is averaged over the whole call.
+    LLM_DURATION_SECONDS.labels(CRITICA_MODEL_NAME).observe(duration)
+    LLM_TIME_TO_FIRST_TOKEN.labels(CRITICA_MODEL_NAME).observe(duration)
+    usage = getattr(result["raw"], "usage_metadata", None) or {}
+    if usage.get("output_tokens") and duration > 0:
+        LLM_TOKENS_PER_SECOND.labels(CRITICA_MODEL_NAME).observe(usage["output_tokens"] / duration)
+
+    if result["parsing_error"] is not None:
+        raise result["parsing_error"]
+    # The parsed Pydantic object
+    return result["parsed"].model_dump()
@@ -1,11 +1,17 @@
 import os
+import json
+import time
+import shutil
 import asyncio
+import argparse
 import httpx
 import toml
 from typing import List, Dict
 from langchain_core.documents import Document
 from langchain_community.embeddings import JinaEmbeddings
 from langchain_community.vectorstores import FAISS
+from resilience import GRAPHQL_URL
+from index_store import INDEX_ROOT, new_version_id, version_path, publish_version
 
 # Try to load secrets if env var is missing
 try:
@@ -21,7 +27,6 @@ try:
 except Exception as e:
     print(f"Warning: Could not load secrets: {e}")
 
-GRAPHQL_URL = "https://rickandmortyapi.com/graphql"
 
 QUERY_CHARACTERS = """
 query ($page: Int) {
@@ -66,83 +71,196 @@ query ($page: Int) {
 }
 """
 
-async def fetch_all_pages(query: str, key: str):
-    all_results = []
-    page = 1
-    async with httpx.AsyncClient() as client:
-        while True:
-            print(f"Fetching {key} page {page}...")
+# In-progress builds are checkpointed here until they are published as a version
+BUILD_DIR = os.path.join(INDEX_ROOT, "build")
+CHECKPOINT_PATH = os.path.join(BUILD_DIR, "checkpoint.json")
+
+# Jina usually has better rate limits, but we'll still batch slightly
+BATCH_SIZE = 100
+# Bounded queues keep at most a few pages/batches in flight between stages
+QUEUE_SIZE = 4
+CHECKPOINT_EVERY = 5  # batches
+FETCH_RETRIES = 3
+
+SOURCES = [("characters", QUERY_CHARACTERS), ("locations", QUERY_LOCATIONS)]
+
+async def fetch_page(client: httpx.AsyncClient, query: str, key: str, page: int):
+    """Fetches one page, retrying transient failures before giving up."""
+    for attempt in range(1, FETCH_RETRIES + 1):
+        try:
             response = await client.post(GRAPHQL_URL, json={"query": query, "variables": {"page": page}})
+            response.raise_for_status()
             data = response.json()
-            
             if "errors" in data:
-                print(f"Error fetching {key}: {data['errors']}")
-                break
-                
-            results = data["data"][key]["results"]
-            all_results.extend(results)
-            
-            if not data["data"][key]["info"]["next"]:
-                break
-            page += 1
-    return all_results
+                raise RuntimeError(data["errors"])
+            return data["data"][key]
+        except Exception as e:
+            if attempt == FETCH_RETRIES:
+                raise
+            print(f"Retrying {key} page {page} after error: {e}")
+            await asyncio.sleep(2 ** attempt)
 
-def create_documents(characters: List[Dict], locations: List[Dict]) -> List[Document]:
-    docs = []
-    
-    for char in characters:
-        content = (
-            f"Character: {char['name']}\n"
-            f"Status: {char['status']}\n"
-            f"Species: {char['species']}\n"
-            f"Type: {char['type']}\n"
-            f"Gender: {char['gender']}\n"
-            f"Origin: {char['origin']['name']}\n"
-            f"Location: {char['location']['name']}"
-        )
-        metadata = {
-            "id": char["id"],
-            "type": "character",
-            "name": char["name"]
-        }
-        docs.append(Document(page_content=content, metadata=metadata))
-        
-    for loc in locations:
-        resident_names = ", ".join([r["name"] for r in loc["residents"][:5]]) # Limit residents to avoid huge text
-        if len(loc["residents"]) > 5:
-            resident_names += f" and {len(loc['residents']) - 5} others"
-            
-        content = (
-            f"Location: {loc['name']}\n"
-            f"Type: {loc['type']}\n"
-            f"Dimension: {loc['dimension']}\n"
-            f"Residents: {resident_names}"
-        )
-        metadata = {
-            "id": loc["id"],
-            "type": "location",
-            "name": loc["name"]
-        }
-        docs.append(Document(page_content=content, metadata=metadata))
+async def iter_pages(query: str, key: str, start_page: int):
+    """Yields (page, results, next_page) starting at start_page."""
+    page = start_page
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        while page:
+            print(f"Fetching {key} page {page}...")
+            data = await fetch_page(client, query, key, page)
+            next_page = data["info"]["next"]
+            yield page, data["results"], next_page
+            page = next_page
+
+def character_document(char: Dict) -> Document:
+    content = (
+        f"Character: {char['name']}\n"
+        f"Status: {char['status']}\n"
+        f"Species: {char['species']}\n"
+        f"Type: {char['type']}\n"
+        f"Gender: {char['gender']}\n"
+        f"Origin: {char['origin']['name']}\n"
+        f"Location: {char['location']['name']}"
+    )
+    metadata = {
+        "id": char["id"],
+        "type": "character",
+        "name": char["name"]
+    }
+    return Document(page_content=content, metadata=metadata)
+
+def location_document(loc: Dict) -> Document:
+    resident_names = ", ".join([r["name"] for r in loc["residents"][:5]]) # Limit residents to avoid huge text
+    if len(loc["residents"]) > 5:
+        resident_names += f" and {len(loc['residents']) - 5} others"
         
-    return docs
+    content = (
+        f"Location: {loc['name']}\n"
+        f"Type: {loc['type']}\n"
+        f"Dimension: {loc['dimension']}\n"
+        f"Residents: {resident_names}"
+    )
+    metadata = {
+        "id": loc["id"],
+        "type": "location",
+        "name": loc["name"]
+    }
+    return Document(page_content=content, metadata=metadata)
+
+DOCUMENT_BUILDERS = {"characters": character_document, "locations": location_document}
+
+def create_documents(characters: List[Dict], locations: List[Dict]) -> List[Document]:
+    return [character_document(c) for c in characters] + [location_document(l) for l in locations]
+
+# --- Checkpoints ---
+
+def load_checkpoint():
+    if not os.path.exists(CHECKPOINT_PATH):
+        return None
+    with open(CHECKPOINT_PATH) as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint: Dict, vector_store):
+    """Saves the partial index to a new snapshot directory, then the checkpoint that describes it.
+
+    The checkpoint is replaced atomically and only ever names a complete snapshot, so a crash
+    at any point resumes from an index that matches its "documents" and "next_page".
+    """
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    previous = checkpoint.get("snapshot")
+    if vector_store is not None:
+        snapshot = f"snapshot-{checkpoint['documents']}"
+        if snapshot != previous:
+            vector_store.save_local(os.path.join(BUILD_DIR, snapshot))
+            checkpoint["snapshot"] = snapshot
+    tmp_path = f"{CHECKPOINT_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+    if previous and previous != checkpoint.get("snapshot"):
+        shutil.rmtree(os.path.join(BUILD_DIR, previous), ignore_errors=True)
+
+# --- Pipeline stages ---
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
 
-async def main():
+    def record(self, items: int, seconds: float):
+        self.items += items
+        self.busy += seconds
+
+    def report(self, elapsed: float):
+        rate = self.items / elapsed if elapsed else 0.0
+        return f"{self.name}: {self.items} docs ({rate:.1f}/s wall, busy {self.busy:.1f}s)"
+
+async def crawl_stage(out_q: asyncio.Queue, next_page: Dict, stats: StageStats):
+    for key, query in SOURCES:
+        if next_page.get(key) is None:
+            continue  # Already fully indexed in a previous run
+        start = time.perf_counter()
+        async for page, results, following in iter_pages(query, key, next_page[key]):
+            stats.record(len(results), time.perf_counter() - start)
+            await out_q.put((key, page, results, following))
+            start = time.perf_counter()
+    await out_q.put(None)
+
+async def document_stage(in_q: asyncio.Queue, out_q: asyncio.Queue, stats: StageStats):
+    """Turns each crawled page into documents, grouping whole pages into embedding batches.
+
+    Batches always end on a page boundary so a checkpoint can record "next page to fetch".
+    """
+    batch, progress = [], {}
+    while (item := await in_q.get()) is not None:
+        key, page, results, following = item
+        start = time.perf_counter()
+        batch.extend(DOCUMENT_BUILDERS[key](r) for r in results)
+        progress[key] = following
+        stats.record(len(results), time.perf_counter() - start)
+        if len(batch) >= BATCH_SIZE:
+            await out_q.put((batch, progress))
+            batch, progress = [], {}
+    if batch or progress:
+        await out_q.put((batch, progress))
+    await out_q.put(None)
+
+async def embed_stage(in_q: asyncio.Queue, out_q: asyncio.Queue, embeddings, stats: StageStats):
+    while (item := await in_q.get()) is not None:
+        batch, progress = item
+        start = time.perf_counter()
+        texts = [d.page_content for d in batch]
+        vectors = await asyncio.to_thread(embeddings.embed_documents, texts) if texts else []
+        stats.record(len(batch), time.perf_counter() - start)
+        await out_q.put((batch, vectors, progress))
+    await out_q.put(None)
+
+async def index_stage(in_q: asyncio.Queue, embeddings, vector_store, checkpoint: Dict, stats: StageStats, report):
+    batches = 0
+    while (item := await in_q.get()) is not None:
+        batch, vectors, progress = item
+        start = time.perf_counter()
+        if batch:
+            text_embeddings = list(zip([d.page_content for d in batch], vectors))
+            metadatas = [d.metadata for d in batch]
+            if vector_store is None:
+                vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+            else:
+                vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+
+        checkpoint["next_page"].update(progress)
+        checkpoint["documents"] += len(batch)
+        batches += 1
+        print(f"Indexed batch {batches} ({len(batch)} docs, {checkpoint['documents']} total)")
+        if batches % CHECKPOINT_EVERY == 0:
+            save_checkpoint(checkpoint, vector_store)
+            print(f"💾 Checkpoint saved at {checkpoint['documents']} docs. {report()}")
+        stats.record(len(batch), time.perf_counter() - start)
+    return vector_store
+
+async def main(fresh: bool = False):
     print("Starting indexing process...")
     
-    # 1. Fetch Data
-    characters = await fetch_all_pages(QUERY_CHARACTERS, "characters")
-    locations = await fetch_all_pages(QUERY_LOCATIONS, "locations")
-    
-    print(f"Fetched {len(characters)} characters and {len(locations)} locations.")
-    
-    # 2. Create Documents
-    docs = create_documents(characters, locations)
-    print(f"Created {len(docs)} documents.")
-    
-    # 3. Embed and Index
-    print("Embedding documents...")
-    
     jina_key = os.environ.get("JINA_API_KEY")
     if not jina_key:
         print("❌ Error: JINA_API_KEY not found in environment or secrets.toml.")
@@ -152,24 +270,66 @@ async def main():
     embeddings = JinaEmbeddings(
         jina_api_key=jina_key, model_name="jina-embeddings-v2-base-en"
     )
-    
-    # Jina usually has better rate limits, but we'll still batch slightly
-    batch_size = 100 
+
+    # 1. Resume an interrupted build, or start a new one
+    if fresh:
+        shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    checkpoint = load_checkpoint()
     vector_store = None
-    
-    for i in range(0, len(docs), batch_size):
-        batch = docs[i : i + batch_size]
-        print(f"Processing batch {i//batch_size + 1}/{(len(docs)-1)//batch_size + 1} ({len(batch)} docs)...")
-        
-        if vector_store is None:
-            vector_store = FAISS.from_documents(batch, embeddings)
-        else:
-            vector_store.add_documents(batch)
-    
-    # 4. Save Index
-    output_dir = os.path.join(os.path.dirname(__file__), "vector_store")
+    if checkpoint:
+        if checkpoint.get("snapshot"):
+            vector_store = FAISS.load_local(
+                os.path.join(BUILD_DIR, checkpoint["snapshot"]), embeddings, allow_dangerous_deserialization=True
+            )
+        print(f"Resuming build {checkpoint['version']} from {checkpoint['documents']} docs "
+              f"(next pages: {checkpoint['next_page']}).")
+    else:
+        checkpoint = {
+            "version": new_version_id(),
+            "next_page": {key: 1 for key, _ in SOURCES},
+            "documents": 0,
+            "snapshot": None,
+        }
+        save_checkpoint(checkpoint, None)
+
+    # 2. crawl -> document -> embed -> index, with bounded queues in between
+    pages_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+    docs_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+    vectors_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+    stats = [StageStats("crawl"), StageStats("document"), StageStats("embed"), StageStats("index")]
+    started = time.perf_counter()
+
+    def report():
+        elapsed = time.perf_counter() - started
+        return " | ".join(s.report(elapsed) for s in stats)
+
+    crawl, document, embed, index = stats
+    results = await asyncio.gather(
+        crawl_stage(pages_q, dict(checkpoint["next_page"]), crawl),
+        document_stage(pages_q, docs_q, document),
+        embed_stage(docs_q, vectors_q, embeddings, embed),
+        index_stage(vectors_q, embeddings, vector_store, checkpoint, index, report),
+    )
+    vector_store = results[-1]
+    save_checkpoint(checkpoint, vector_store)
+    print(f"Indexed {checkpoint['documents']} documents in {time.perf_counter() - started:.1f}s.")
+    print(report())
+
+    if vector_store is None:
+        print("❌ No documents were indexed.")
+        return
+
+    # 3. Save Index as a new version, then point the manifest at it.
+    # Running servers pick it up without a restart (see INDEX_WATCH_INTERVAL).
+    version = checkpoint["version"]
+    output_dir = version_path(version)
     vector_store.save_local(output_dir)
-    print(f"Index saved to {output_dir}")
+    publish_version(version, vector_store.index.ntotal)
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    print(f"Index version {version} saved to {output_dir} and published")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Build the FAISS index from the Rick & Morty API.")
+    parser.add_argument("--fresh", action="store_true", help="Discard any interrupted build instead of resuming it.")
+    args = parser.parse_args()
+    asyncio.run(main(fresh=args.fresh))
@@ -1,6 +1,7 @@
-import httpx
+from resilience import graphql_query
 
-GRAPHQL_URL = "https://rickandmortyapi.com/graphql"
+# Upstream failures raise resilience.UpstreamUnavailable unless a last-good response can be
+# served instead, so callers no longer mistake an outage for an empty result.
 
 async def fetch_locations(page: int = 1):
     query = """
@@ -13,10 +14,6 @@ async def fetch_locations(page: int = 1):
           dimension
           residents {
             id
-            name
-            status
-            species
-            image
           }
         }
       }
@@ -24,16 +21,52 @@ async def fetch_locations(page: int = 1):
     """
     variables = {"page": page}
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(GRAPHQL_URL, json={"query": query, "variables": variables})
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("data", {}).get("locations", {}).get("results", [])
-            return []
-        except Exception as e:
-            print(f"Error fetching locations: {e}")
-            return []
+    data = await graphql_query("locations", query, variables)
+    results = (data.get("locations") or {}).get("results", [])
+    # Only ship resident counts; details are paged in via fetch_location_residents.
+    # Build new dicts: `data` may be the shared last-good copy.
+    return [
+        {**{k: v for k, v in loc.items() if k != "residents"}, "resident_count": len(loc.get("residents") or [])}
+        for loc in results
+    ]
+
+async def fetch_location_residents(location_id: str, offset: int = 0, limit: int = 20, names_only: bool = False):
+    """Returns one page of a location's residents, or None if the location does not exist.
+
+    With `names_only`, residents are just `{id, name}` straight from the location query;
+    otherwise the page is hydrated with the full character fields.
+    """
+    query = """
+    query ($id: ID!) {
+      location(id: $id) {
+        residents {
+          id
+          name
+        }
+      }
+    }
+    """
+    variables = {"id": str(location_id)}
+
+    data = await graphql_query("locationResidents", query, variables)
+    location = data.get("location")
+    if location is None:
+        return None
+
+    all_residents = location.get("residents") or []
+    page = all_residents[offset : offset + limit]
+    if names_only:
+        residents = [{"id": r["id"], "name": r["name"]} for r in page]
+    else:
+        # Only hydrate the requested slice so large locations stay cheap
+        residents = await fetch_characters_by_ids([r["id"] for r in page])
+    return {
+        "location_id": str(location_id),
+        "total": len(all_residents),
+        "offset": offset,
+        "limit": limit,
+        "residents": residents,
+    }
 
 async def fetch_characters_by_ids(ids: list[str]):
     if not ids:
@@ -63,18 +96,10 @@ async def fetch_characters_by_ids(ids: list[str]):
     """
     variables = {"ids": ids}
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(GRAPHQL_URL, json={"query": query, "variables": variables})
-            if response.status_code == 200:
-                data = response.json()
-                # Handle potential [null] response if IDs are invalid
-                results = data.get("data", {}).get("charactersByIds", [])
-                return [r for r in results if r is not None]
-            return []
-        except Exception as e:
-            print(f"Error fetching characters: {e}")
-            return []
+    data = await graphql_query("charactersByIds", query, variables)
+    # Handle potential [null] response if IDs are invalid
+    results = data.get("charactersByIds") or []
+    return [r for r in results if r is not None]
 
 async def fetch_locations_by_ids(ids: list[str]):
     if not ids:
@@ -102,14 +127,6 @@ async def fetch_locations_by_ids(ids: list[str]):
     """
     variables = {"ids": ids}
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(GRAPHQL_URL, json={"query": query, "variables": variables})
-            if response.status_code == 200:
-                data = response.json()
-                results = data.get("data", {}).get("locationsByIds", [])
-                return [r for r in results if r is not None]
-            return []
-        except Exception as e:
-            print(f"Error fetching locations: {e}")
-            return []
+    data = await graphql_query("locationsByIds", query, variables)
+    results = data.get("locationsByIds") or []
+    return [r for r in results if r is not None]
@@ -2,17 +2,39 @@ from pydantic import BaseModel
 from typing import List, Optional
 import time
 import os
-from supabase import create_client, Client
+import sqlite3
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from metrics import SUPABASE_SECONDS
 load_dotenv()
-# Initialize Supabase client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables must be set")
+# "supabase" (default) or "sqlite". SQLite keeps notes in a local file and is meant for
+# offline development and the benchmark harness (see bench/).
+NOTES_BACKEND = os.getenv("NOTES_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(__file__), "notes.db"))
+USE_SQLITE = NOTES_BACKEND == "sqlite"
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+if not USE_SQLITE:
+    from supabase import create_client, Client
+
+    # Initialize Supabase client
+    SUPABASE_URL = os.getenv("SUPABASE_URL")
+    SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables must be set")
+
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+@contextmanager
+def _sqlite_connect():
+    conn = sqlite3.connect(SQLITE_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:  # Commits on success, rolls back on error
+            yield conn
+    finally:
+        conn.close()
 
 def init_db():
     """
@@ -27,7 +49,20 @@ def init_db():
     );
     CREATE INDEX idx_character_id ON notes(character_id);
     """
-    pass  # Table creation should be done via Supabase dashboard
+    if not USE_SQLITE:
+        return  # Table creation should be done via Supabase dashboard
+
+    with _sqlite_connect() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                character_id TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_character_id ON notes(character_id)")
 
 class Note(BaseModel):
     character_id: str
@@ -36,11 +71,20 @@ class Note(BaseModel):
 
 def add_note(note: Note):
     timestamp = time.time()
-    response = supabase.table("notes").insert({
-        "character_id": note.character_id,
-        "content": note.content,
-        "timestamp": timestamp
-    }).execute()
+    if USE_SQLITE:
+        with _sqlite_connect() as conn:
+            conn.execute(
+                "INSERT INTO notes (character_id, content, timestamp) VALUES (?, ?, ?)",
+                (note.character_id, note.content, timestamp),
+            )
+        return {"character_id": note.character_id, "content": note.content, "timestamp": timestamp}
+
+    with SUPABASE_SECONDS.labels("add_note").time():
+        response = supabase.table("notes").insert({
+            "character_id": note.character_id,
+            "content": note.content,
+            "timestamp": timestamp
+        }).execute()
     
     if not response.data:
         raise Exception("Failed to insert note")
@@ -48,15 +92,38 @@ def add_note(note: Note):
     return {"character_id": note.character_id, "content": note.content, "timestamp": timestamp}
 
 def get_notes(character_id: str):
-    response = supabase.table("notes").select("content, timestamp").eq("character_id", character_id).order("timestamp", desc=True).execute()
+    if USE_SQLITE:
+        with _sqlite_connect() as conn:
+            rows = conn.execute(
+                "SELECT content, timestamp FROM notes WHERE character_id = ? ORDER BY timestamp DESC",
+                (character_id,),
+            ).fetchall()
+        return [{"content": r["content"], "timestamp": r["timestamp"]} for r in rows]
+
+    with SUPABASE_SECONDS.labels("get_notes").time():
+        response = supabase.table("notes").select("content, timestamp").eq("character_id", character_id).order("timestamp", desc=True).execute()
     return [{"content": r["content"], "timestamp": r["timestamp"]} for r in response.data]
 
 def get_notes_bulk(character_ids: List[str]):
     if not character_ids:
         return {}
+
+    if USE_SQLITE:
+        placeholders = ",".join("?" * len(character_ids))
+        with _sqlite_connect() as conn:
+            rows = conn.execute(
+                f"SELECT character_id, content, timestamp FROM notes WHERE character_id IN ({placeholders}) "
+                "ORDER BY timestamp DESC",
+                list(character_ids),
+            ).fetchall()
+        notes_map = {cid: [] for cid in character_ids}
+        for r in rows:
+            notes_map[r["character_id"]].append({"content": r["content"], "timestamp": r["timestamp"]})
+        return notes_map
     
     # Supabase doesn't support IN operator the same way, so we fetch all and filter
-    response = supabase.table("notes").select("character_id, content, timestamp").in_("character_id", character_ids).order("timestamp", desc=True).execute()
+    with SUPABASE_SECONDS.labels("get_notes_bulk").time():
+        response = supabase.table("notes").select("character_id, content, timestamp").in_("character_id", character_ids).order("timestamp", desc=True).execute()
     
     # Group by character_id
     notes_map = {cid: [] for cid in character_ids}
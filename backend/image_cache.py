@@ -0,0 +1,160 @@
+import os
+import io
+import time
+import asyncio
+from collections import OrderedDict
+import httpx
+from PIL import Image
+from metrics import IMAGE_CACHE_BYTES, IMAGE_CACHE_FILES
+
+AVATAR_URL = "https://rickandmortyapi.com/api/character/avatar/{character_id}.jpeg"
+
+CACHE_DIR = os.environ.get(
+    "IMAGE_CACHE_DIR", os.path.join(os.path.dirname(__file__), "image_cache")
+)
+# The frontend displays avatars at 80-100px, so 128px keeps them crisp at a fraction of the size
+THUMBNAIL_SIZE = int(os.environ.get("IMAGE_THUMBNAIL_SIZE", "128"))
+THUMBNAIL_QUALITY = 80
+MAX_CACHE_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+# Unknown ids are remembered for a while so they don't hit the CDN on every request
+MISSING_TTL = float(os.environ.get("IMAGE_MISSING_TTL", "600"))
+MAX_MISSING_ENTRIES = 10000
+
+class _FetchLock:
+    """A per-character lock plus the number of requests holding or waiting for it."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+# One lock per character so concurrent misses only hit the CDN once
+_fetch_locks: dict[str, _FetchLock] = {}
+_cleanup_lock = asyncio.Lock()
+# character_id -> monotonic time until which the CDN 404 is trusted
+_missing: OrderedDict[str, float] = OrderedDict()
+
+
+def _thumbnail_path(character_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{character_id}_{THUMBNAIL_SIZE}.webp")
+
+
+def _make_thumbnail(raw: bytes) -> bytes:
+    with Image.open(io.BytesIO(raw)) as img:
+        img = img.convert("RGB")
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        out = io.BytesIO()
+        img.save(out, format="WEBP", quality=THUMBNAIL_QUALITY, method=6)
+        return out.getvalue()
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _evict_lru():
+    """Deletes least recently served thumbnails until the cache fits MAX_CACHE_BYTES."""
+    entries = []
+    total = 0
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(".webp"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+    if total <= MAX_CACHE_BYTES:
+        IMAGE_CACHE_BYTES.set(total)
+        IMAGE_CACHE_FILES.set(len(entries))
+        return
+
+    # mtime is bumped on every hit (atime is often disabled), so oldest mtime == least recently used
+    entries.sort()
+    files = len(entries)
+    for _, size, path in entries:
+        if total <= MAX_CACHE_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            files -= 1
+        except FileNotFoundError:
+            pass
+    IMAGE_CACHE_BYTES.set(total)
+    IMAGE_CACHE_FILES.set(files)
+
+
+def _is_missing(character_id: str) -> bool:
+    expires = _missing.get(character_id)
+    if expires is None:
+        return False
+    if expires < time.monotonic():
+        del _missing[character_id]
+        return False
+    return True
+
+
+def _mark_missing(character_id: str):
+    _missing[character_id] = time.monotonic() + MISSING_TTL
+    _missing.move_to_end(character_id)
+    if len(_missing) > MAX_MISSING_ENTRIES:
+        _missing.popitem(last=False)
+
+
+def _read_cached(path: str):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # Mark as recently used for LRU cleanup
+        return data
+    except FileNotFoundError:
+        return None
+
+
+async def get_thumbnail(character_id: str):
+    """Returns WebP thumbnail bytes for a character, fetching and caching them on first use.
+
+    Returns None if the upstream avatar does not exist.
+    """
+    if _is_missing(character_id):
+        return None
+    path = _thumbnail_path(character_id)
+    data = await asyncio.to_thread(_read_cached, path)
+    if data is not None:
+        return data
+
+    entry = _fetch_locks.setdefault(character_id, _FetchLock())
+    entry.users += 1
+    try:
+        async with entry.lock:
+            # Another request may have filled the cache (or found the id missing) while we waited
+            if _is_missing(character_id):
+                return None
+            data = await asyncio.to_thread(_read_cached, path)
+            if data is not None:
+                return data
+
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.get(AVATAR_URL.format(character_id=character_id))
+            if response.status_code == 404:
+                _mark_missing(character_id)
+                return None
+            response.raise_for_status()
+
+            data = await asyncio.to_thread(_make_thumbnail, response.content)
+            await asyncio.to_thread(_write_atomic, path, data)
+    finally:
+        # Drop the lock once nobody holds or waits for it (including after failures), so the
+        # dict stays bounded without letting a newer request's lock be replaced under it
+        entry.users -= 1
+        if entry.users == 0 and _fetch_locks.get(character_id) is entry:
+            del _fetch_locks[character_id]
+
+    if not _cleanup_lock.locked():
+        async with _cleanup_lock:
+            await asyncio.to_thread(_evict_lru)
+    return data
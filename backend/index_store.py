@@ -0,0 +1,241 @@
+import os
+import gc
+import json
+import shutil
+import time
+import threading
+from datetime import datetime, timezone
+from metrics import VECTOR_INDEX_DOCUMENTS
+
+INDEX_ROOT = os.environ.get(
+    "VECTOR_STORE_DIR", os.path.join(os.path.dirname(__file__), "vector_store")
+)
+MANIFEST_PATH = os.path.join(INDEX_ROOT, "manifest.json")
+VERSIONS_DIR = os.path.join(INDEX_ROOT, "versions")
+# Number of published versions kept on disk for rollback
+KEEP_VERSIONS = int(os.environ.get("VECTOR_STORE_KEEP_VERSIONS", "3"))
+# Indexes saved before versioning live directly in INDEX_ROOT
+LEGACY_VERSION = "legacy"
+
+# --- Manifest ---
+
+def new_version_id() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def version_path(version: str) -> str:
+    if version == LEGACY_VERSION:
+        return INDEX_ROOT
+    return os.path.join(VERSIONS_DIR, version)
+
+def read_manifest():
+    """Returns the manifest, synthesising one for a pre-versioning index if needed."""
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    if os.path.exists(os.path.join(INDEX_ROOT, "index.faiss")):
+        return {"current": LEGACY_VERSION, "versions": [{"version": LEGACY_VERSION}]}
+    return {"current": None, "versions": []}
+
+def write_manifest(manifest: dict):
+    os.makedirs(INDEX_ROOT, exist_ok=True)
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    # os.replace is atomic, so readers never see a half-written manifest
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def publish_version(version: str, documents: int):
+    """Marks a fully written version directory as current and prunes old versions."""
+    manifest = read_manifest()
+    versions = [v for v in manifest["versions"] if v["version"] not in (version, LEGACY_VERSION)]
+    versions.append({
+        "version": version,
+        "documents": documents,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+    kept, pruned = versions[-KEEP_VERSIONS:], versions[:-KEEP_VERSIONS]
+    write_manifest({"current": version, "versions": kept})
+
+    for old in pruned:
+        shutil.rmtree(version_path(old["version"]), ignore_errors=True)
+    return kept
+
+def set_current_version(version: str):
+    """Points the manifest at an already published version, e.g. for a rollback.
+
+    Every worker's manifest watcher then swaps it in, and restarts keep it.
+    """
+    manifest = read_manifest()
+    manifest["current"] = version
+    write_manifest(manifest)
+
+def has_version(manifest: dict, version: str) -> bool:
+    return any(v["version"] == version for v in manifest["versions"])
+
+def previous_version(manifest: dict, version: str):
+    """Returns the version published just before the given one, if any."""
+    names = [v["version"] for v in manifest["versions"]]
+    if version not in names:
+        return None
+    idx = names.index(version)
+    return names[idx - 1] if idx > 0 else None
+
+# --- Loaded index handles ---
+
+# Outcomes of IndexManager.load
+LOAD_OK = "loaded"
+LOAD_BUSY = "busy"
+LOAD_FAILED = "failed"
+LOAD_MISSING = "missing"
+
+class IndexNotLoaded(Exception):
+    """Raised when no index version is loaded yet."""
+
+class LoadedIndex:
+    """A loaded vector store plus the number of searches currently using it."""
+
+    def __init__(self, version: str, store):
+        self.version = version
+        self.store = store
+        self.readers = 0
+        self.retired = False
+
+class IndexManager:
+    """Holds the live index and swaps in new versions without interrupting searches.
+
+    Searches take a lease with `acquire()`. A swap only replaces the pointer to the live
+    index; searches that already hold a lease finish on the old one, whose store is dropped
+    as soon as its last reader returns it.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._current = None
+        # One of: not_loaded, loading, ready, missing, failed
+        self._state = {"status": "not_loaded", "error": None, "load_seconds": None, "loading_version": None}
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def loading(self) -> bool:
+        return self._reload_lock.locked()
+
+    def status(self):
+        with self._lock:
+            state = dict(self._state)
+            state["version"] = self._current.version if self._current else None
+            state["documents"] = self._current.store.index.ntotal if self._current else None
+        return state
+
+    def acquire(self):
+        """Returns a context manager leasing the live index for one search."""
+        with self._lock:
+            handle = self._current
+            if handle is None:
+                raise IndexNotLoaded(self._state["status"])
+            handle.readers += 1
+        return _Lease(self, handle)
+
+    def _release(self, handle: LoadedIndex):
+        with self._lock:
+            handle.readers -= 1
+            drop = handle.retired and handle.readers == 0
+        if drop:
+            self._drop(handle)
+
+    def _drop(self, handle: LoadedIndex):
+        handle.store = None
+        gc.collect()
+        print(f"🗑️ Released index version {handle.version}.")
+
+    def load(self, version=None):
+        """Loads a version (default: the manifest's current one) and swaps it in.
+
+        Blocking, so run it in a worker thread. Returns LOAD_OK once the version is live,
+        LOAD_BUSY if another load is in progress, LOAD_FAILED if it could not be loaded (the
+        live index, if any, is kept) or LOAD_MISSING if there is no index at all.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return LOAD_BUSY
+        try:
+            manifest = read_manifest()
+            version = version or manifest["current"]
+            if version is None:
+                with self._lock:
+                    self._state.update(status="missing", error=f"No index in {INDEX_ROOT}")
+                return LOAD_MISSING
+            if self._current is not None and self._current.version == version:
+                return LOAD_OK
+
+            with self._lock:
+                # Keep reporting "ready" while a new version loads behind a live one
+                if self._current is None:
+                    self._state["status"] = "loading"
+                self._state.update(loading_version=version, error=None)
+
+            start = time.perf_counter()
+            try:
+                store = self._loader(version_path(version))
+            except Exception as e:
+                print(f"❌ Error loading index version {version}: {e}")
+                with self._lock:
+                    self._state.update(
+                        status="ready" if self._current else "failed",
+                        error=str(e),
+                        loading_version=None,
+                    )
+                return LOAD_FAILED
+            load_seconds = time.perf_counter() - start
+
+            self._swap(LoadedIndex(version, store), load_seconds)
+            print(f"✅ Index version {version} live with {store.index.ntotal} documents "
+                  f"(loaded in {load_seconds:.2f}s).")
+            return LOAD_OK
+        finally:
+            self._reload_lock.release()
+
+    def _swap(self, handle: LoadedIndex, load_seconds: float):
+        with self._lock:
+            old = self._current
+            self._current = handle
+            VECTOR_INDEX_DOCUMENTS.set(handle.store.index.ntotal)
+            self._state.update(
+                status="ready", error=None, loading_version=None, load_seconds=round(load_seconds, 3)
+            )
+            drop = False
+            if old is not None:
+                old.retired = True
+                drop = old.readers == 0
+        if drop:
+            self._drop(old)
+
+class _Lease:
+    def __init__(self, manager: IndexManager, handle: LoadedIndex):
+        self._manager = manager
+        self.handle = handle
+
+    @property
+    def store(self):
+        return self.handle.store
+
+    @property
+    def version(self):
+        return self.handle.version
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._manager._release(self.handle)
+        return False
+
+def manifest_mtime():
+    try:
+        return os.path.getmtime(MANIFEST_PATH)
+    except FileNotFoundError:
+        return None
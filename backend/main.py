@@ -1,13 +1,60 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
-from typing import List, Dict
+import time
+_IMPORT_START = time.perf_counter()
+
+import os
+import asyncio
+from fastapi import FastAPI, HTTPException, Query, Request, Header, Depends
+from fastapi.responses import StreamingResponse, Response
+from typing import List, Dict, Optional, Literal
 from database import init_db, add_note, get_notes, get_notes_bulk, Note
-from client import fetch_locations, fetch_characters_by_ids, fetch_locations_by_ids
-from ai_service import generate_location_summary_stream, evaluate_summary, search_knowledge_base, get_vector_store
+from client import fetch_locations, fetch_location_residents, fetch_characters_by_ids, fetch_locations_by_ids
+from image_cache import get_thumbnail
+from responses import json_response, cacheable_json_response, make_etag, etag_matches, WireSizeMiddleware
+from metrics import render_latest, RequestLatencyMiddleware
+from profiler import sample_profile, ProfilerBusy, MAX_PROFILE_SECONDS
+from admission import AdmissionControlMiddleware
+from resilience import (
+    StaleResponseMiddleware, UpstreamUnavailable, upstream_unavailable_handler, is_stale,
+    breaker_states, close_client,
+)
+from ai_service import (
+    generate_location_summary_stream, evaluate_summary, search_knowledge_base, embed_query,
+    get_vector_store, vector_store_status, VectorStoreNotReady, index_manager,
+)
+from semantic_cache import SemanticCache
+from index_store import (
+    read_manifest, has_version, previous_version, manifest_mtime, set_current_version,
+    LOAD_OK, LOAD_BUSY,
+)
 from pydantic import BaseModel
+from brotli_asgi import BrotliMiddleware
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
 
 app = FastAPI(title="Rick & Morty AI Explorer")
 
+# Marks responses built from last-good upstream data (see resilience.py)
+app.add_middleware(StaleResponseMiddleware)
+
+# Compress JSON responses above the threshold (brotli, falling back to gzip).
+# Streamed narration and already-compressed WebP thumbnails are left alone.
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+app.add_middleware(
+    BrotliMiddleware,
+    minimum_size=COMPRESSION_MIN_BYTES,
+    gzip_fallback=True,
+    excluded_handlers=[r"^/generate-summary", r"^/images/"],
+)
+# Added after compression so it wraps it and sees the bytes actually sent
+app.add_middleware(WireSizeMiddleware)
+# Rejected requests should cost as little as possible
+app.add_middleware(AdmissionControlMiddleware)
+# Outermost, so latency covers every middleware and shed requests too
+app.add_middleware(RequestLatencyMiddleware)
+
+# Upstream location data rarely changes, so clients may reuse it for a few minutes
+LOCATIONS_MAX_AGE = 300
+
 class SummaryRequest(BaseModel):
     name: str
     type: str
@@ -15,13 +62,108 @@ class SummaryRequest(BaseModel):
 
 class SearchRequest(BaseModel):
     query: str
+    include_raw_matches: bool = True
+
+class IndexReloadRequest(BaseModel):
+    version: Optional[str] = None
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+# How often to check the index manifest for a newly published version (0 disables)
+INDEX_WATCH_INTERVAL = float(os.environ.get("INDEX_WATCH_INTERVAL", "10"))
+
+# Near-duplicate queries ("rick's best friend" / "who is Rick's best friend?") share results
+search_cache = SemanticCache(live_version=lambda: vector_store_status()["version"])
 
-# Initialize Database and Vector Store on Startup
+# Seconds a client should wait before retrying a search while the index warms up
+SEARCH_RETRY_AFTER = 5
+
+_database_ready = False
+
+async def warm_vector_store():
+    start = time.perf_counter()
+    await asyncio.to_thread(get_vector_store)
+    print(f"⏱️ Vector store warmup finished in {time.perf_counter() - start:.2f}s "
+          f"(status: {vector_store_status()['status']}).")
+
+async def watch_index_manifest():
+    """Hot-swaps the index whenever the manifest's current version changes.
+
+    The manifest is the source of truth for every worker: build_index.py publishes to it and
+    the admin reload/rollback endpoints rewrite it, so all workers (and restarts) follow.
+    """
+    last_mtime = manifest_mtime()
+    while True:
+        await asyncio.sleep(INDEX_WATCH_INTERVAL)
+        try:
+            mtime = manifest_mtime()
+            if mtime == last_mtime:
+                continue
+            current = read_manifest()["current"]
+            live = vector_store_status()["version"]
+            if current and current != live:
+                print(f"👀 Index manifest now points at {current} (live: {live}), reloading.")
+                if await asyncio.to_thread(index_manager.load, current) == LOAD_BUSY:
+                    continue  # Another load is running; retry on the next tick
+            last_mtime = mtime
+        except Exception as e:
+            # e.g. a hand-edited manifest; keep watching so a fixed one is still picked up
+            print(f"❌ Error checking index manifest: {e!r}")
+
+def _load_and_make_current(version: str):
+    """Loads `version` on this worker and, only if that worked, points the manifest at it."""
+    result = index_manager.load(version)
+    if result == LOAD_OK:
+        set_current_version(version)
+    return result
+
+def _index_load_done(task: asyncio.Task):
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        print(f"❌ Index load failed: {task.exception()!r}")
+    elif task.result() == LOAD_BUSY:
+        print("⏳ Another index load was already running; the manifest was left unchanged.")
+    elif task.result() != LOAD_OK:
+        print(f"❌ Index load {task.result()}; the manifest was left unchanged.")
+
+def start_index_load(version: str):
+    """Loads `version` on this worker in the background, then makes it the manifest's current one.
+
+    The manifest is only rewritten once the load succeeded, so a broken version never reaches
+    the other workers (which follow through their manifest watcher) or restarts.
+    """
+    task = asyncio.create_task(asyncio.to_thread(_load_and_make_current, version))
+    # Keep a reference so the task isn't garbage collected, and log its outcome
+    app.state.index_load = task
+    task.add_done_callback(_index_load_done)
+
+# Initialize Database on Startup; the vector store loads in the background
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
+    global _database_ready
+    start = time.perf_counter()
     init_db()
-    # Pre-load the vector store to avoid first-request timeout
-    get_vector_store()
+    _database_ready = True
+    init_db_seconds = time.perf_counter() - start
+
+    # Loading the index can take seconds, so don't hold up accepting traffic for it
+    app.state.vector_store_warmup = asyncio.create_task(warm_vector_store())
+    if INDEX_WATCH_INTERVAL > 0:
+        app.state.index_watcher = asyncio.create_task(watch_index_manifest())
+    print(f"⏱️ Startup: imports {IMPORT_SECONDS:.2f}s, init_db {init_db_seconds:.2f}s, "
+          f"vector store loading in background.")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await close_client()
+
+app.add_exception_handler(UpstreamUnavailable, upstream_unavailable_handler)
 
 @app.get("/")
 async def read_root():
@@ -29,20 +171,120 @@ async def read_root():
 
 @app.get("/health")
 async def health_check():
+    # Liveness only; see /ready for whether dependencies are usable
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    checks = {
+        "database": {"status": "ready" if _database_ready else "not_loaded"},
+        "vector_store": vector_store_status(),
+        "llm": {"status": "configured" if os.environ.get("OPENAI_API_KEY") else "missing_api_key"},
+        # Informational: open circuits degrade responses to stale data but don't fail readiness
+        "graphql": {"circuits": breaker_states()},
+    }
+    ready = checks["database"]["status"] == "ready" and checks["vector_store"]["status"] == "ready"
+    body = {"status": "ready" if ready else "not_ready", "checks": checks}
+    return json_response(body, "/ready", status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    payload, content_type = render_latest()
+    return Response(content=payload, media_type=content_type)
+
+@app.get("/admin/index", dependencies=[Depends(require_admin)])
+async def index_info():
+    return {"live": vector_store_status(), "manifest": read_manifest()}
+
+@app.post("/admin/index/reload", status_code=202, dependencies=[Depends(require_admin)])
+async def reload_index(request: IndexReloadRequest):
+    """Makes a version (default: the manifest's current one) current and swaps it in."""
+    manifest = read_manifest()
+    version = request.version or manifest["current"]
+    if version is None or not has_version(manifest, version):
+        raise HTTPException(status_code=404, detail=f"Index version {version} not found")
+    if index_manager.loading:
+        raise HTTPException(status_code=409, detail="Another index load is in progress")
+    # Searches keep using the live index until the new one is fully loaded
+    start_index_load(version)
+    return {"status": "loading", "version": version}
+
+@app.post("/admin/index/rollback", status_code=202, dependencies=[Depends(require_admin)])
+async def rollback_index():
+    # Relative to the manifest's current version, so repeated rollbacks keep stepping back
+    manifest = read_manifest()
+    version = previous_version(manifest, manifest["current"])
+    if version is None:
+        raise HTTPException(status_code=404, detail="No previous index version to roll back to")
+    if index_manager.loading:
+        raise HTTPException(status_code=409, detail="Another index load is in progress")
+    start_index_load(version)
+    return {"status": "loading", "version": version}
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+):
+    """Samples all threads for `seconds` and returns folded stacks for flame graph tools."""
+    try:
+        folded = await asyncio.to_thread(sample_profile, seconds, interval_ms / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=folded, media_type="text/plain")
+
+@app.get("/admin/search-cache", dependencies=[Depends(require_admin)])
+async def search_cache_info():
+    return search_cache.stats()
+
 @app.get("/locations")
-async def get_locations(page: int = 1):
+async def get_locations(request: Request, page: int = 1):
     locations = await fetch_locations(page)
-    return locations
+    return cacheable_json_response(request, locations, "/locations", max_age=LOCATIONS_MAX_AGE)
+
+@app.get("/locations/{location_id}/residents")
+async def get_location_residents(
+    request: Request,
+    location_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=500),
+    fields: Literal["full", "names"] = "full",
+):
+    # "names" skips hydrating every resident, for callers such as the narrator that only need names
+    page = await fetch_location_residents(location_id, offset, limit, names_only=fields == "names")
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"Location {location_id} not found")
+    return cacheable_json_response(
+        request, page, "/locations/{location_id}/residents", max_age=LOCATIONS_MAX_AGE
+    )
+
+# Thumbnails for a given character never change, so browsers may keep them for a year
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@app.get("/images/{character_id}")
+async def get_character_image(character_id: int, request: Request):
+    try:
+        data = await get_thumbnail(str(character_id))
+    except Exception as e:
+        print(f"❌ Image Error for character {character_id}: {e}")
+        raise HTTPException(status_code=502, detail="Could not fetch character image")
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Character {character_id} has no image")
+
+    etag = make_etag(data)
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/webp", headers=headers)
 
 @app.post("/notes")
 async def create_note(note: Note):
     return add_note(note)
 
 @app.get("/notes/{character_id}")
-async def read_notes(character_id: str):
-    return get_notes(character_id)
+async def read_notes(request: Request, character_id: str):
+    # Notes change whenever one is added, so clients must revalidate (cheap with the ETag)
+    return cacheable_json_response(request, get_notes(character_id), "/notes/{character_id}")
 
 @app.post("/notes/bulk")
 async def read_notes_bulk(character_ids: List[str]):
@@ -58,36 +300,66 @@ async def get_summary(request: SummaryRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def run_search(query: str, vector):
+    """Returns the hydrated search result and the index version it came from."""
+    # 2. Get semantic search results
+    raw_results, version = await search_knowledge_base(query, vector=vector)
+    print(f"✅ Found {len(raw_results)} raw matches from vector store.")
+    
+    # 3. Extract IDs
+    char_ids = []
+    loc_ids = []
+    
+    for res in raw_results:
+        meta = res["metadata"]
+        print(f"   - Match: {meta.get('name')} ({meta.get('type')}) ID: {meta.get('id')}")
+        if meta["type"] == "character":
+            char_ids.append(meta["id"])
+        elif meta["type"] == "location":
+            loc_ids.append(meta["id"])
+    
+    # 4. Fetch full details from GraphQL
+    characters = await fetch_characters_by_ids(char_ids)
+    locations = await fetch_locations_by_ids(loc_ids)
+    print(f"📦 Fetched {len(characters)} characters and {len(locations)} locations from GraphQL.")
+    
+    return {
+        "characters": characters,
+        "locations": locations,
+        "raw_matches": raw_results,
+    }, version
+
 @app.post("/search")
 async def search_endpoint(request: SearchRequest):
     try:
         print(f"🔎 Searching for: {request.query}")
-        # 1. Get semantic search results
-        raw_results = await search_knowledge_base(request.query)
-        print(f"✅ Found {len(raw_results)} raw matches from vector store.")
-        
-        # 2. Extract IDs
-        char_ids = []
-        loc_ids = []
-        
-        for res in raw_results:
-            meta = res["metadata"]
-            print(f"   - Match: {meta.get('name')} ({meta.get('type')}) ID: {meta.get('id')}")
-            if meta["type"] == "character":
-                char_ids.append(meta["id"])
-            elif meta["type"] == "location":
-                loc_ids.append(meta["id"])
-        
-        # 3. Fetch full details from GraphQL
-        characters = await fetch_characters_by_ids(char_ids)
-        locations = await fetch_locations_by_ids(loc_ids)
-        print(f"📦 Fetched {len(characters)} characters and {len(locations)} locations from GraphQL.")
-        
-        return {
-            "characters": characters,
-            "locations": locations,
-            "raw_matches": raw_results # Optional: keep for debugging or relevance scores
-        }
+        if vector_store_status()["version"] is None:
+            raise VectorStoreNotReady(vector_store_status()["status"])
+
+        # 1. Embed once; the vector drives both the cache lookup and the index search.
+        # The index may be swapped while embedding, so read the version only afterwards.
+        vector = await embed_query(request.query)
+        result = search_cache.lookup(vector, vector_store_status()["version"])
+        if result is not None:
+            print("⚡ Served from semantic search cache.")
+        else:
+            result, searched_version = await run_search(request.query, vector)
+            # Don't pin empty or stale hydrations (e.g. GraphQL hiccups) in the cache
+            if (result["characters"] or result["locations"]) and not is_stale():
+                search_cache.store(vector, searched_version, request.query, result)
+
+        # Full document text is only useful for debugging or relevance checks
+        if not request.include_raw_matches:
+            result = {k: v for k, v in result.items() if k != "raw_matches"}
+        return json_response(result, "/search")
+    except VectorStoreNotReady as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Search index is not ready yet ({e})",
+            headers={"Retry-After": str(SEARCH_RETRY_AFTER)},
+        )
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         print(f"❌ Search Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
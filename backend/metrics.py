@@ -0,0 +1,184 @@
+import time
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+# Network calls and whole requests
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# --- HTTP ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Request latency per route, including the full body of streamed responses.",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+RESPONSE_PAYLOAD_BYTES = Histogram(
+    "http_response_payload_bytes",
+    "Size of serialized JSON response bodies before compression.",
+    ["route", "encoder"],
+    buckets=SIZE_BUCKETS,
+)
+RESPONSE_SERIALIZATION_SECONDS = Histogram(
+    "http_response_serialization_seconds",
+    "Time spent serializing JSON response bodies.",
+    ["route", "encoder"],
+    buckets=FAST_BUCKETS,
+)
+RESPONSE_WIRE_BYTES = Histogram(
+    "http_response_wire_bytes",
+    "Size of response bodies as sent on the wire, after compression.",
+    ["route", "encoding"],
+    buckets=SIZE_BUCKETS,
+)
+
+SEARCH_CACHE_LOOKUPS = Counter(
+    "search_cache_lookups_total",
+    "Semantic search cache lookups by result.",
+    ["result"],
+)
+SEARCH_CACHE_SIMILARITY = Histogram(
+    "search_cache_best_similarity",
+    "Cosine similarity between a query and its closest cached query.",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.88, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0),
+)
+SEARCH_CACHE_ENTRIES = Gauge(
+    "search_cache_entries",
+    "Number of queries currently held in the semantic search cache.",
+)
+
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Admission control outcomes for expensive routes (admitted, rate_limited, shed_queue, shed_timeout).",
+    ["route", "outcome"],
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Requests currently holding a concurrency slot, per route.",
+    ["route"],
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued",
+    "Requests waiting for a concurrency slot, per route.",
+    ["route"],
+)
+
+# --- Search ---
+
+EMBEDDING_SECONDS = Histogram(
+    "embedding_request_duration_seconds",
+    "Latency of query embedding calls.",
+    buckets=LATENCY_BUCKETS,
+)
+FAISS_SEARCH_SECONDS = Histogram(
+    "faiss_search_duration_seconds",
+    "Time spent in the FAISS nearest-neighbour search.",
+    buckets=FAST_BUCKETS,
+)
+VECTOR_INDEX_DOCUMENTS = Gauge(
+    "vector_index_documents",
+    "Documents in the live vector index.",
+)
+
+# --- Upstreams ---
+
+GRAPHQL_SECONDS = Histogram(
+    "graphql_request_duration_seconds",
+    "Rick & Morty GraphQL latency per operation, including hedging.",
+    ["operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+GRAPHQL_HEDGED = Counter(
+    "graphql_hedged_requests_total",
+    "Duplicate requests sent because the first one was slow.",
+    ["operation"],
+)
+GRAPHQL_STALE_SERVED = Counter(
+    "graphql_stale_responses_total",
+    "Last-good responses served because the upstream failed or its circuit was open.",
+    ["operation"],
+)
+GRAPHQL_CIRCUIT_OPEN = Gauge(
+    "graphql_circuit_open",
+    "1 while the circuit breaker for an operation is open or half-open.",
+    ["operation"],
+)
+GRAPHQL_IN_FLIGHT = Gauge(
+    "graphql_requests_in_flight",
+    "GraphQL requests currently using the shared connection pool.",
+)
+GRAPHQL_STALE_ENTRIES = Gauge(
+    "graphql_stale_cache_entries",
+    "Last-good GraphQL responses kept for serve-stale.",
+)
+SUPABASE_SECONDS = Histogram(
+    "supabase_request_duration_seconds",
+    "Supabase latency per notes operation.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# --- LLM ---
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from request to the first token (the whole response, for calls that are not streamed).",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second",
+    "Streamed chunks per second after the first token, or output tokens over the whole call when not streamed.",
+    ["model"],
+    buckets=(1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400),
+)
+LLM_DURATION_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "Total duration of an LLM call.",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# --- Caches ---
+
+IMAGE_CACHE_BYTES = Gauge(
+    "image_cache_bytes",
+    "Bytes of thumbnails on disk, as of the last cleanup scan.",
+)
+IMAGE_CACHE_FILES = Gauge(
+    "image_cache_files",
+    "Thumbnails on disk, as of the last cleanup scan.",
+)
+
+class RequestLatencyMiddleware:
+    """Observes request latency per route template (e.g. /notes/{character_id})."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(route, scope["method"], str(status["code"])).observe(
+                time.perf_counter() - start
+            )
+
+def render_latest():
+    """Returns the Prometheus exposition payload and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
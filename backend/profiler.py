@@ -0,0 +1,53 @@
+import sys
+import time
+import threading
+from collections import Counter
+
+MAX_PROFILE_SECONDS = 60
+DEFAULT_INTERVAL = 0.01  # 100 Hz
+
+# Only one profile at a time; nothing is sampled unless a profile is running
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _folded_stack(frame, thread_name: str) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        # Function-level (not line-level) frames so samples aggregate cleanly in a flame graph
+        frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+def sample_profile(seconds: float, interval: float = DEFAULT_INTERVAL) -> str:
+    """Samples every thread's stack for `seconds` and returns collapsed stacks.
+
+    The output is Brendan Gregg's folded format ("frame;frame;frame count" per line), which
+    flamegraph.pl, speedscope and inferno read directly. Blocking, so run it in a worker thread.
+    Note that coroutines waiting on I/O are not on any stack; the event loop thread shows
+    what is actually running (or blocking) the loop.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        seconds = min(seconds, MAX_PROFILE_SECONDS)
+        me = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stacks[_folded_stack(frame, names.get(ident, f"thread-{ident}"))] += 1
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
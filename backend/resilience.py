@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict, deque
+import httpx
+from fastapi.responses import JSONResponse
+from metrics import (
+    GRAPHQL_SECONDS, GRAPHQL_HEDGED, GRAPHQL_STALE_SERVED, GRAPHQL_CIRCUIT_OPEN,
+    GRAPHQL_IN_FLIGHT, GRAPHQL_STALE_ENTRIES,
+)
+
+GRAPHQL_URL = os.environ.get("RICK_MORTY_GRAPHQL_URL", "https://rickandmortyapi.com/graphql")
+
+# Hard limit for one GraphQL call, including any hedged duplicate (seconds)
+GRAPHQL_DEADLINE = float(os.environ.get("GRAPHQL_DEADLINE", "5"))
+# Send a duplicate request once the first one is slower than this latency percentile
+HEDGE_PERCENTILE = float(os.environ.get("GRAPHQL_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = 0.05
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# Consecutive failures that open a breaker, and how long it stays open (seconds)
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("GRAPHQL_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("GRAPHQL_BREAKER_RESET", "15"))
+STALE_CACHE_ENTRIES = 1000
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream call fails and there is no cached response to fall back to."""
+
+
+async def upstream_unavailable_handler(request, exc: UpstreamUnavailable):
+    # Fail fast while the upstream is down instead of letting clients wait out a timeout
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(BREAKER_RESET_TIMEOUT))},
+    )
+
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker around one upstream operation."""
+
+    def __init__(self, threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            # Let exactly one probe through to test the upstream
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Called when a call is cancelled before its outcome is known."""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                print(f"⚡ Circuit opened after {self.failures} failures.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[idx]
+
+
+# --- Stale responses ---
+
+# Holds a mutable per-request dict, so flags set deep in the call stack reach the middleware
+_request_flags = contextvars.ContextVar("request_flags", default=None)
+
+def mark_stale():
+    flags = _request_flags.get()
+    if flags is not None:
+        flags["stale"] = True
+
+def is_stale() -> bool:
+    flags = _request_flags.get()
+    return bool(flags and flags.get("stale"))
+
+
+class StaleResponseMiddleware:
+    """Flags responses built from fallback data so clients and caches don't keep them."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        flags = {"stale": False}
+        token = _request_flags.set(flags)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and flags["stale"]:
+                headers = [(k, v) for k, v in message.get("headers", []) if k.lower() != b"cache-control"]
+                headers.append((b"warning", b'110 - "Response is Stale"'))
+                headers.append((b"cache-control", b"no-cache"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_flags.reset(token)
+
+
+# --- GraphQL access ---
+
+_client = None
+_breakers = {}
+_latencies = {}
+_last_good = OrderedDict()
+
+def get_client() -> httpx.AsyncClient:
+    """Shared client, so calls reuse pooled keep-alive connections."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            timeout=GRAPHQL_DEADLINE,
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def breaker_states():
+    return {operation: breaker.state for operation, breaker in _breakers.items()}
+
+async def _post(query: str, variables: dict):
+    with GRAPHQL_IN_FLIGHT.track_inprogress():
+        response = await get_client().post(GRAPHQL_URL, json={"query": query, "variables": variables})
+    response.raise_for_status()
+    data = response.json()
+    if data.get("errors") and not data.get("data"):
+        raise RuntimeError(f"GraphQL errors: {data['errors']}")
+    return data.get("data") or {}
+
+async def _hedged_post(operation: str, query: str, variables: dict):
+    """Sends the request, plus one duplicate if it outlives the usual latency; first success wins."""
+    first = asyncio.create_task(_post(query, variables))
+    hedge_delay = _latencies[operation].percentile(HEDGE_PERCENTILE)
+    tasks = {first}
+    try:
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=max(hedge_delay, HEDGE_MIN_DELAY))
+            if not done:
+                GRAPHQL_HEDGED.labels(operation).inc()
+                tasks.add(asyncio.create_task(_post(query, variables)))
+
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def graphql_query(operation: str, query: str, variables: dict, deadline: float = GRAPHQL_DEADLINE):
+    """Runs a GraphQL read through the breaker, hedging and deadline for `operation`.
+
+    On failure (or with the breaker open) the last good response for the same variables is
+    returned and the request is marked stale; without one, UpstreamUnavailable is raised.
+    """
+    breaker = _breakers.setdefault(operation, CircuitBreaker())
+    _latencies.setdefault(operation, LatencyTracker())
+    key = (operation, json.dumps(variables, sort_keys=True))
+
+    if breaker.allow():
+        start = time.monotonic()
+        try:
+            data = await asyncio.wait_for(_hedged_post(operation, query, variables), deadline)
+        except asyncio.CancelledError:
+            # e.g. the client disconnected; don't leave a half-open probe stuck in flight
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            GRAPHQL_SECONDS.labels(operation, "error").observe(time.monotonic() - start)
+            breaker.record_failure()
+            print(f"Error calling GraphQL {operation}: {e!r}")
+        else:
+            elapsed = time.monotonic() - start
+            GRAPHQL_SECONDS.labels(operation, "success").observe(elapsed)
+            breaker.record_success()
+            _latencies[operation].record(elapsed)
+            _last_good[key] = data
+            _last_good.move_to_end(key)
+            if len(_last_good) > STALE_CACHE_ENTRIES:
+                _last_good.popitem(last=False)
+            GRAPHQL_STALE_ENTRIES.set(len(_last_good))
+            return data
+        finally:
+            GRAPHQL_CIRCUIT_OPEN.labels(operation).set(0 if breaker.state == "closed" else 1)
+
+    if key in _last_good:
+        GRAPHQL_STALE_SERVED.labels(operation).inc()
+        mark_stale()
+        return _last_good[key]
+    raise UpstreamUnavailable(f"Rick & Morty API unavailable ({operation}, circuit {breaker.state})")
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import hashlib
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+from metrics import RESPONSE_PAYLOAD_BYTES, RESPONSE_SERIALIZATION_SECONDS, RESPONSE_WIRE_BYTES
+
+# Set to also time the stdlib encoder on every response, for before/after comparisons
+COMPARE_JSON_ENCODERS = os.environ.get("COMPARE_JSON_ENCODERS", "").lower() in ("1", "true", "yes")
+
+
+def make_etag(data: bytes, weak: bool = False) -> str:
+    etag = f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+    return f"W/{etag}" if weak else etag
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/"x" and "x" match each other."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque_tag(etag) in [_opaque_tag(tag.strip()) for tag in if_none_match.split(",")]
+
+
+def serialize(payload, route: str) -> bytes:
+    """Serializes a payload with orjson, recording size and timing for the route."""
+    if COMPARE_JSON_ENCODERS:
+        start = time.perf_counter()
+        baseline = json.dumps(payload).encode("utf-8")
+        RESPONSE_SERIALIZATION_SECONDS.labels(route, "json").observe(time.perf_counter() - start)
+        RESPONSE_PAYLOAD_BYTES.labels(route, "json").observe(len(baseline))
+
+    start = time.perf_counter()
+    body = orjson.dumps(payload)
+    RESPONSE_SERIALIZATION_SECONDS.labels(route, "orjson").observe(time.perf_counter() - start)
+    RESPONSE_PAYLOAD_BYTES.labels(route, "orjson").observe(len(body))
+    return body
+
+
+def json_response(payload, route: str, status_code: int = 200) -> Response:
+    return Response(content=serialize(payload, route), status_code=status_code, media_type="application/json")
+
+
+def cacheable_json_response(request: Request, payload, route: str, max_age: int = 0) -> Response:
+    """JSON response with an ETag that answers matching If-None-Match with a 304.
+
+    The ETag is weak because it is computed before compression: the br, gzip and identity
+    encodings of the body are different bytes that share it.
+    """
+    body = serialize(payload, route)
+    etag = make_etag(body, weak=True)
+    cache_control = f"public, max-age={max_age}" if max_age else "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class WireSizeMiddleware:
+    """Records response body sizes as sent, i.e. after any compression middleware it wraps."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = {"encoding": "identity", "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-encoding":
+                        state["encoding"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    route = scope.get("route")
+                    route_path = getattr(route, "path", "unmatched")
+                    RESPONSE_WIRE_BYTES.labels(route_path, state["encoding"]).observe(state["bytes"])
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,113 @@
+import os
+import time
+import itertools
+from collections import OrderedDict, deque
+import numpy as np
+from metrics import SEARCH_CACHE_LOOKUPS, SEARCH_CACHE_SIMILARITY, SEARCH_CACHE_ENTRIES
+
+# A cached result is reused when the query embeddings are within this cosine distance
+SEARCH_CACHE_MAX_DISTANCE = float(os.environ.get("SEARCH_CACHE_MAX_DISTANCE", "0.08"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "512"))
+# Recent best-match similarities kept for the stats endpoint
+SIMILARITY_SAMPLES = 1000
+
+
+def _normalize(vector):
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class SemanticCache:
+    """LRU + TTL cache of hydrated search results, keyed by query embedding.
+
+    Entries belong to one index version. With `live_version` (a callable returning the live
+    index version) the cache follows the live index: it empties itself when that changes, and
+    lookups or stores for any other version (a request that raced a swap) bypass it instead of
+    clearing it. Without it, the cache follows the version of each call.
+    """
+
+    def __init__(self, max_distance=SEARCH_CACHE_MAX_DISTANCE, ttl=SEARCH_CACHE_TTL,
+                 max_entries=SEARCH_CACHE_MAX_ENTRIES, live_version=None):
+        self._live_version = live_version
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # id -> (unit vector, created_at, query, result)
+        self._ids = itertools.count()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self._similarities = deque(maxlen=SIMILARITY_SAMPLES)
+
+    def clear(self):
+        self._entries.clear()
+        SEARCH_CACHE_ENTRIES.set(0)
+
+    def _check_version(self, version) -> bool:
+        """Moves the cache to the live version if needed; returns whether `version` is it."""
+        live = self._live_version() if self._live_version else version
+        if live != self._version:
+            if self._entries:
+                print(f"🧹 Index version changed ({self._version} -> {live}), clearing search cache.")
+            self.clear()
+            self._version = live
+        return version == live
+
+    def _expire(self, now):
+        expired = [key for key, (_, created, _, _) in self._entries.items() if now - created > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, vector, version):
+        """Returns the cached result for the closest query within max_distance, or None."""
+        if not self._check_version(version):
+            SEARCH_CACHE_LOOKUPS.labels("bypass").inc()
+            return None
+        self._expire(time.monotonic())
+
+        best_key, best_similarity = None, None
+        if self._entries:
+            keys = list(self._entries)
+            matrix = np.stack([self._entries[key][0] for key in keys])
+            similarities = matrix @ _normalize(vector)
+            idx = int(np.argmax(similarities))
+            best_key, best_similarity = keys[idx], float(similarities[idx])
+            self._similarities.append(best_similarity)
+            SEARCH_CACHE_SIMILARITY.observe(best_similarity)
+
+        SEARCH_CACHE_ENTRIES.set(len(self._entries))
+        if best_key is not None and 1.0 - best_similarity <= self.max_distance:
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            SEARCH_CACHE_LOOKUPS.labels("hit").inc()
+            return self._entries[best_key][3]
+
+        self.misses += 1
+        SEARCH_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    def store(self, vector, version, query, result):
+        # A result computed against an index that has since been swapped out is not cached
+        if not self._check_version(version):
+            return
+        self._entries[next(self._ids)] = (_normalize(vector), time.monotonic(), query, result)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        SEARCH_CACHE_ENTRIES.set(len(self._entries))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        samples = np.asarray(self._similarities) if self._similarities else None
+        return {
+            "entries": len(self._entries),
+            "index_version": self._version,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "best_similarity_percentiles": {
+                f"p{p}": round(float(np.percentile(samples, p)), 4) for p in (10, 50, 90, 99)
+            } if samples is not None else None,
+        }
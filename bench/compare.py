@@ -0,0 +1,50 @@
+"""Compares two run_bench.py result files, level by level and operation by operation.
+
+    python bench/compare.py before.json after.json
+"""
+import sys
+import json
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main(before_path, after_path):
+    before, after = load(before_path), load(after_path)
+    print(f"before: {before['meta']['commit']} ({before['meta']['timestamp']})")
+    print(f"after:  {after['meta']['commit']} ({after['meta']['timestamp']})")
+
+    before_levels = {lvl["concurrency"]: lvl for lvl in before["levels"]}
+    for level in after["levels"]:
+        old = before_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        print(f"\n== concurrency {level['concurrency']}: "
+              f"{old['throughput_rps']} -> {level['throughput_rps']} req/s "
+              f"({change(old['throughput_rps'], level['throughput_rps'])})")
+        print(f"{'operation':<12}{'metric':<8}{'before':>10}{'after':>10}{'change':>10}")
+        for op in sorted(set(old["ops"]) | set(level["ops"])):
+            old_op, new_op = old["ops"].get(op), level["ops"].get(op)
+            if not old_op or not new_op:
+                continue
+            rows = [("req/s", old_op["throughput_rps"], new_op["throughput_rps"])]
+            for key in ("latency_ms", "ttft_ms"):
+                if old_op.get(key) and new_op.get(key):
+                    prefix = "" if key == "latency_ms" else "ttft "
+                    rows += [(f"{prefix}{p}", old_op[key][p], new_op[key][p]) for p in ("p50", "p95", "p99")]
+            for metric, b, a in rows:
+                print(f"{op:<12}{metric:<8}{b:>10}{a:>10}{change(b, a):>10}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2])
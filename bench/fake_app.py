@@ -0,0 +1,82 @@
+"""The backend app wired to local fakes, for offline benchmarks.
+
+    uvicorn fake_app:app --app-dir bench --port 8000
+
+Environment (all optional):
+    BENCH_WORKDIR            directory for the index, SQLite notes and image cache (default: temp dir)
+    RICK_MORTY_GRAPHQL_URL   fake GraphQL server (default http://127.0.0.1:8100/graphql)
+    FAKE_EMBED_LATENCY_MS    added latency per embedding call
+    FAKE_LLM_TTFT_MS         time to first token for the fake chat models
+    FAKE_LLM_TOKEN_MS        delay between streamed tokens
+"""
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "backend"))
+sys.path.insert(0, BENCH_DIR)
+
+WORKDIR = os.environ.get("BENCH_WORKDIR") or tempfile.mkdtemp(prefix="rick-morty-bench-")
+os.makedirs(WORKDIR, exist_ok=True)
+
+# Must be set before the backend modules read them at import time
+_defaults = {
+    "NOTES_BACKEND": "sqlite",
+    "SQLITE_PATH": os.path.join(WORKDIR, "notes.db"),
+    "VECTOR_STORE_DIR": os.path.join(WORKDIR, "vector_store"),
+    "IMAGE_CACHE_DIR": os.path.join(WORKDIR, "image_cache"),
+    "RICK_MORTY_GRAPHQL_URL": "http://127.0.0.1:8100/graphql",
+    "INDEX_WATCH_INTERVAL": "0",
+    "OPENAI_API_KEY": "fake",
+    # Bench workers fire requests far faster than any person, so only the concurrency caps should bite
+    "ADMISSION_CLIENT_RATE": "1000000",
+    "ADMISSION_CLIENT_BURST": "1000000",
+    "ADMISSION_GLOBAL_RATE": "1000000",
+    "ADMISSION_GLOBAL_BURST": "1000000",
+}
+for name, value in _defaults.items():
+    os.environ.setdefault(name, value)
+
+import ai_service
+import database
+from fakes import FakeEmbeddings, FakeStreamingChatModel
+
+def _ms(name: str) -> float:
+    return float(os.environ.get(name, "0")) / 1000
+
+ai_service._embeddings = FakeEmbeddings(latency=_ms("FAKE_EMBED_LATENCY_MS"))
+ai_service._summary_model = FakeStreamingChatModel(
+    ttft=_ms("FAKE_LLM_TTFT_MS"), token_delay=_ms("FAKE_LLM_TOKEN_MS"), model_name="fake-summary"
+)
+ai_service._critica_model = FakeStreamingChatModel(ttft=_ms("FAKE_LLM_TTFT_MS"), model_name="fake-critic")
+
+
+def _prepare_workdir():
+    """Builds the index from the fake dataset and seeds notes, once per workdir."""
+    from index_store import read_manifest, new_version_id, version_path, publish_version
+
+    if read_manifest()["current"] is not None:
+        return
+
+    from langchain_community.vectorstores import FAISS
+    from build_index import create_documents
+    from fake_graphql import build_dataset
+
+    characters, locations = build_dataset()
+    docs = create_documents(list(characters.values()), list(locations.values()))
+    store = FAISS.from_documents(docs, FakeEmbeddings())
+    version = new_version_id()
+    store.save_local(version_path(version))
+    publish_version(version, store.index.ntotal)
+
+    database.init_db()
+    for character_id in list(characters)[:200]:
+        for i in range(3):
+            database.add_note(database.Note(character_id=character_id, content=f"Bench note {i} for {character_id}"))
+    print(f"Prepared bench workdir {WORKDIR} ({len(docs)} docs indexed).")
+
+
+_prepare_workdir()
+
+from main import app  # noqa: E402
@@ -0,0 +1,136 @@
+"""Local stand-in for the Rick & Morty GraphQL API, with latency and fault injection.
+
+Serves deterministic synthetic characters and locations for the handful of operations the
+backend uses. Point the backend at it with:
+
+    RICK_MORTY_GRAPHQL_URL=http://127.0.0.1:8100/graphql
+
+Faults can be set at startup through FAKE_GRAPHQL_* environment variables or changed at
+runtime with `POST /_faults {"latency_ms": 200, "error_rate": 0.1, ...}`.
+"""
+import os
+import re
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+N_CHARACTERS = int(os.environ.get("FAKE_GRAPHQL_CHARACTERS", "826"))
+N_LOCATIONS = int(os.environ.get("FAKE_GRAPHQL_LOCATIONS", "126"))
+PAGE_SIZE = 20
+
+FIRST_NAMES = ["Rick", "Morty", "Summer", "Beth", "Jerry", "Birdperson", "Squanchy", "Unity",
+               "Tammy", "Evil", "Mr.", "Abradolf", "Krombopulos", "Noob-Noob", "Gearhead"]
+LAST_NAMES = ["Sanchez", "Smith", "Poopybutthole", "Lincler", "Michael", "Meeseeks", "Nimbus",
+              "Goldenfold", "Gazorpazorp", "Plutonian", "Cronenberg", "Squanch"]
+SPECIES = ["Human", "Alien", "Humanoid", "Robot", "Cronenberg", "Mythological Creature"]
+STATUSES = ["Alive", "Dead", "unknown"]
+LOCATION_TYPES = ["Planet", "Space station", "Microverse", "Dimension", "Dream", "Resort"]
+
+FAULTS = {
+    "latency_ms": float(os.environ.get("FAKE_GRAPHQL_LATENCY_MS", "0")),
+    "jitter_ms": float(os.environ.get("FAKE_GRAPHQL_JITTER_MS", "0")),
+    # Fraction of requests answered with HTTP 500
+    "error_rate": float(os.environ.get("FAKE_GRAPHQL_ERROR_RATE", "0")),
+    # Fraction of requests that hang for hang_ms before answering
+    "hang_rate": float(os.environ.get("FAKE_GRAPHQL_HANG_RATE", "0")),
+    "hang_ms": float(os.environ.get("FAKE_GRAPHQL_HANG_MS", "30000")),
+}
+
+
+def build_dataset(seed: int = 42):
+    rng = random.Random(seed)
+    locations = {
+        str(i): {
+            "id": str(i),
+            "name": f"{rng.choice(LAST_NAMES)} {rng.choice(LOCATION_TYPES)} {i}",
+            "type": rng.choice(LOCATION_TYPES),
+            "dimension": f"Dimension C-{rng.randint(1, 999)}",
+            "residents": [],
+        }
+        for i in range(1, N_LOCATIONS + 1)
+    }
+    characters = {}
+    for i in range(1, N_CHARACTERS + 1):
+        # Skewed on purpose: a few locations end up with hundreds of residents
+        loc_id = str(min(N_LOCATIONS, int(rng.paretovariate(1.2))))
+        origin_id = str(rng.randint(1, N_LOCATIONS))
+        char = {
+            "id": str(i),
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "status": rng.choice(STATUSES),
+            "species": rng.choice(SPECIES),
+            "type": "",
+            "gender": rng.choice(["Male", "Female", "unknown"]),
+            "image": f"https://rickandmortyapi.com/api/character/avatar/{(i % 826) + 1}.jpeg",
+            "origin": {"name": locations[origin_id]["name"]},
+            "location": {"name": locations[loc_id]["name"]},
+        }
+        characters[char["id"]] = char
+        locations[loc_id]["residents"].append(char)
+    return characters, locations
+
+
+CHARACTERS, LOCATIONS = build_dataset()
+
+app = FastAPI(title="Fake Rick & Morty GraphQL")
+
+
+def _page(items, page: int):
+    page = page or 1
+    start = (page - 1) * PAGE_SIZE
+    has_next = start + PAGE_SIZE < len(items)
+    return {"info": {"next": page + 1 if has_next else None}, "results": items[start:start + PAGE_SIZE]}
+
+
+def resolve(query: str, variables: dict):
+    """Answers by operation name; clients ignore fields they did not ask for."""
+    if "charactersByIds" in query:
+        return {"charactersByIds": [CHARACTERS.get(str(i)) for i in variables.get("ids", [])]}
+    if "locationsByIds" in query:
+        return {"locationsByIds": [LOCATIONS.get(str(i)) for i in variables.get("ids", [])]}
+    if re.search(r"\blocation\s*\(", query):
+        return {"location": LOCATIONS.get(str(variables.get("id")))}
+    if re.search(r"\blocations\s*\(", query):
+        return {"locations": _page(list(LOCATIONS.values()), variables.get("page", 1))}
+    if re.search(r"\bcharacters\s*\(", query):
+        return {"characters": _page(list(CHARACTERS.values()), variables.get("page", 1))}
+    return None
+
+
+@app.post("/graphql")
+async def graphql(request: Request):
+    delay = FAULTS["latency_ms"] + random.uniform(0, FAULTS["jitter_ms"])
+    if random.random() < FAULTS["hang_rate"]:
+        delay = FAULTS["hang_ms"]
+    if delay:
+        await asyncio.sleep(delay / 1000)
+    if random.random() < FAULTS["error_rate"]:
+        return JSONResponse(status_code=500, content={"error": "injected fault"})
+
+    body = await request.json()
+    data = resolve(body.get("query", ""), body.get("variables") or {})
+    if data is None:
+        return {"errors": [{"message": "Unsupported query"}], "data": None}
+    return {"data": data}
+
+
+@app.get("/_faults")
+async def get_faults():
+    return FAULTS
+
+
+@app.post("/_faults")
+async def set_faults(faults: dict):
+    FAULTS.update({k: float(v) for k, v in faults.items() if k in FAULTS})
+    return FAULTS
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,98 @@
+"""Deterministic stand-ins for Jina embeddings and the OpenAI chat models."""
+import re
+import time
+import asyncio
+import hashlib
+from typing import Any, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+EMBEDDING_DIM = 768  # Same as jina-embeddings-v2-base-en
+
+FAKE_NARRATION = (
+    "Welcome to {location}, Morty, another pointless rock spinning through an infinite multiverse. "
+    "The locals range from mildly disappointing to existentially horrifying, and the gift shop "
+    "only sells regret. Bring a portal gun and low expectations. "
+    "Danger Rating: 7/10 - Even the air has a grudge."
+)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: deterministic, and paraphrases land close together."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9']+", text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            vec[int.from_bytes(digest[:4], "little") % EMBEDDING_DIM] += 1.0
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Streams a canned narration word by word with a configurable TTFT and token rate."""
+
+    ttft: float = 0.3
+    token_delay: float = 0.02
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _text(self, messages) -> str:
+        match = re.search(r"Location Name: (.+)", str(messages[-1].content)) if messages else None
+        return FAKE_NARRATION.format(location=match.group(1).strip() if match else "this dump")
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.ttft)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._text(messages)))])
+
+    async def _astream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self.ttft)
+        for i, word in enumerate(self._text(messages).split(" ")):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            token = word if i == 0 else f" {word}"
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def with_structured_output(self, schema, include_raw: bool = False, **kwargs):
+        """Returns a runnable that answers with a perfect score after `ttft` seconds."""
+        def build(_):
+            parsed = schema(score=10, reasoning="Fake evaluator: every resident checks out.")
+            if not include_raw:
+                return parsed
+            raw = AIMessage(
+                content=parsed.model_dump_json(),
+                usage_metadata={"input_tokens": 0, "output_tokens": 24, "total_tokens": 24},
+            )
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+        async def abuild(_):
+            await asyncio.sleep(self.ttft)
+            return build(_)
+
+        return RunnableLambda(build, afunc=abuild)
@@ -0,0 +1,309 @@
+"""Offline load test for the backend.
+
+Starts the fake GraphQL server and the backend (wired to fake embeddings, fake streaming chat
+models and SQLite notes, see fake_app.py), then drives a mixed workload at each concurrency
+level and writes throughput, p50/p95/p99 latency and time-to-first-token to a JSON file.
+
+    python bench/run_bench.py --concurrency 1,8,32 --duration 20
+    python bench/compare.py bench/results/<before>.json bench/results/<after>.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import Counter
+from datetime import datetime, timezone
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+DEFAULT_MIX = "locations=35,residents=20,search=25,notes_bulk=15,summary=5"
+
+# Groups of paraphrases, so the semantic cache sees realistic near-duplicates
+QUERIES = [
+    "rick's best friend", "who is Rick's best friend?", "best friend of rick",
+    "a dead alien", "aliens that are dead", "dead alien characters",
+    "space station", "locations that are space stations",
+    "robots", "robot characters", "a cronenberg planet", "planets full of cronenbergs",
+    "Morty Smith", "where does Morty live", "microverse", "dream locations",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=REPO_DIR) != 0
+        return f"{commit}-dirty" if dirty else commit
+    except Exception:
+        return "unknown"
+
+
+async def wait_until_ready(url: str, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def percentile(ordered, p: float):
+    if not ordered:
+        return None
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def summarize_ms(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "p50": round(percentile(ordered, 50) * 1000, 2),
+        "p95": round(percentile(ordered, 95) * 1000, 2),
+        "p99": round(percentile(ordered, 99) * 1000, 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.ttft = []
+
+    def record(self, op: str, seconds: float, status: int):
+        self.statuses.setdefault(op, Counter())[status] += 1
+        if 200 <= status < 400:
+            self.latencies.setdefault(op, []).append(seconds)
+
+
+# --- Operations ---
+
+async def op_locations(client, rng, rec, cfg):
+    start = time.perf_counter()
+    resp = await client.get("/locations", params={"page": rng.randint(1, cfg["location_pages"])})
+    rec.record("locations", time.perf_counter() - start, resp.status_code)
+
+async def op_residents(client, rng, rec, cfg):
+    start = time.perf_counter()
+    location_id = rng.randint(1, cfg["locations"])
+    resp = await client.get(f"/locations/{location_id}/residents", params={"offset": 0, "limit": 12})
+    rec.record("residents", time.perf_counter() - start, resp.status_code)
+
+async def op_search(client, rng, rec, cfg):
+    start = time.perf_counter()
+    resp = await client.post("/search", json={"query": rng.choice(QUERIES), "include_raw_matches": False})
+    rec.record("search", time.perf_counter() - start, resp.status_code)
+
+async def op_notes_bulk(client, rng, rec, cfg):
+    ids = [str(rng.randint(1, cfg["characters"])) for _ in range(rng.randint(12, 60))]
+    start = time.perf_counter()
+    resp = await client.post("/notes/bulk", json=ids)
+    rec.record("notes_bulk", time.perf_counter() - start, resp.status_code)
+
+async def op_summary(client, rng, rec, cfg):
+    residents = [{"name": f"Resident {rng.randint(1, cfg['characters'])}"} for _ in range(rng.randint(0, 8))]
+    body = {"name": f"Bench Location {rng.randint(1, cfg['locations'])}", "type": "Planet", "residents": residents}
+    start = time.perf_counter()
+    first_chunk = None
+    async with client.stream("POST", "/generate-summary", json=body) as resp:
+        async for chunk in resp.aiter_text():
+            if chunk and first_chunk is None:
+                first_chunk = time.perf_counter()
+    if first_chunk is not None and resp.status_code == 200:
+        rec.ttft.append(first_chunk - start)
+    rec.record("summary", time.perf_counter() - start, resp.status_code)
+
+OPERATIONS = {
+    "locations": op_locations,
+    "residents": op_residents,
+    "search": op_search,
+    "notes_bulk": op_notes_bulk,
+    "summary": op_summary,
+}
+
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+async def worker(client, deadline, weights, rng, rec, cfg):
+    names, values = list(weights), list(weights.values())
+    while time.monotonic() < deadline:
+        op = rng.choices(names, values)[0]
+        try:
+            await OPERATIONS[op](client, rng, rec, cfg)
+        except httpx.HTTPError as e:
+            rec.record(op, 0.0, 0)  # 0 == transport error / timeout
+            print(f"  {op} failed: {e!r}")
+
+
+async def run_level(base_url, concurrency, duration, weights, seed, cfg):
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        deadline = time.monotonic() + duration
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            worker(client, deadline, weights, random.Random(seed * 1000 + i), rec, cfg)
+            for i in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    ops = {}
+    for op, statuses in rec.statuses.items():
+        count = sum(statuses.values())
+        ok = sum(n for status, n in statuses.items() if 200 <= status < 400)
+        ops[op] = {
+            "count": count,
+            "errors": count - ok,
+            "status_counts": {str(k): v for k, v in sorted(statuses.items())},
+            "throughput_rps": round(ok / elapsed, 2),
+            "latency_ms": summarize_ms(rec.latencies.get(op, [])),
+        }
+    if "summary" in ops:
+        ops["summary"]["ttft_ms"] = summarize_ms(rec.ttft)
+
+    total_ok = sum(len(v) for v in rec.latencies.values())
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "total_requests": sum(sum(s.values()) for s in rec.statuses.values()),
+        "throughput_rps": round(total_ok / elapsed, 2),
+        "ops": ops,
+    }
+
+
+def print_level(level):
+    print(f"\n== concurrency {level['concurrency']}: {level['throughput_rps']} req/s "
+          f"({level['total_requests']} requests in {level['duration_s']}s)")
+    print(f"{'operation':<12}{'count':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for op, stats in sorted(level["ops"].items()):
+        lat = stats["latency_ms"] or {"p50": "-", "p95": "-", "p99": "-"}
+        print(f"{op:<12}{stats['count']:>8}{stats['errors']:>8}{stats['throughput_rps']:>9}"
+              f"{lat['p50']:>10}{lat['p95']:>10}{lat['p99']:>10}")
+        if stats.get("ttft_ms"):
+            ttft = stats["ttft_ms"]
+            print(f"{'  ttft':<12}{'':>25}{ttft['p50']:>10}{ttft['p95']:>10}{ttft['p99']:>10}")
+
+
+def start_services(args, workdir):
+    graphql_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "FAKE_GRAPHQL_LATENCY_MS": str(args.graphql_latency_ms),
+        "FAKE_GRAPHQL_JITTER_MS": str(args.graphql_jitter_ms),
+        "FAKE_GRAPHQL_ERROR_RATE": str(args.graphql_error_rate),
+        "FAKE_GRAPHQL_CHARACTERS": str(args.characters),
+        "FAKE_GRAPHQL_LOCATIONS": str(args.locations),
+        "RICK_MORTY_GRAPHQL_URL": f"http://127.0.0.1:{graphql_port}/graphql",
+        "FAKE_EMBED_LATENCY_MS": str(args.embed_latency_ms),
+        "FAKE_LLM_TTFT_MS": str(args.llm_ttft_ms),
+        "FAKE_LLM_TOKEN_MS": str(args.llm_token_ms),
+        "BENCH_WORKDIR": workdir,
+    }
+    graphql = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_graphql.py"), "--port", str(graphql_port)], env=env
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fake_app:app", "--app-dir", BENCH_DIR,
+         "--port", str(app_port), "--log-level", "warning"],
+        env=env,
+    )
+    return [graphql, backend], f"http://127.0.0.1:{graphql_port}", f"http://127.0.0.1:{app_port}"
+
+
+async def main(args):
+    weights = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    cfg = {
+        "characters": args.characters,
+        "locations": args.locations,
+        "location_pages": max(1, (args.locations + 19) // 20),
+    }
+
+    workdir = tempfile.mkdtemp(prefix="rick-morty-bench-")
+    processes, graphql_url, base_url = start_services(args, workdir)
+    try:
+        await wait_until_ready(f"{graphql_url}/_faults")
+        await wait_until_ready(f"{base_url}/ready")
+        print(f"Backend ready at {base_url} (workdir {workdir}).")
+
+        if args.warmup:
+            print(f"Warming up for {args.warmup}s...")
+            await run_level(base_url, max(levels), args.warmup, weights, args.seed + 1, cfg)
+
+        results = []
+        for concurrency in levels:
+            level = await run_level(base_url, concurrency, args.duration, weights, args.seed, cfg)
+            print_level(level)
+            results.append(level)
+    finally:
+        for proc in processes:
+            proc.terminate()
+        for proc in processes:
+            proc.wait(timeout=10)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "levels": results,
+    }
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test against local fakes.")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per concurrency level.")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of unrecorded warmup.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted operations (default: {DEFAULT_MIX}).")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--characters", type=int, default=826)
+    parser.add_argument("--locations", type=int, default=126)
+    parser.add_argument("--graphql-latency-ms", type=float, default=50)
+    parser.add_argument("--graphql-jitter-ms", type=float, default=30)
+    parser.add_argument("--graphql-error-rate", type=float, default=0.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=40)
+    parser.add_argument("--llm-ttft-ms", type=float, default=400)
+    parser.add_argument("--llm-token-ms", type=float, default=25)
+    parser.add_argument("--output", help="Result JSON path (default: bench/results/<timestamp>-<commit>.json).")
+    asyncio.run(main(parser.parse_args()))
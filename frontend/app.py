@@ -1,3 +1,7 @@
+import os
+import hmac
+import uuid
+import hashlib
 import streamlit as st
 import httpx
 import asyncio
@@ -5,9 +9,27 @@ import json
 
 # Configuration
 BACKEND_URL = "http://localhost:8000"
+# Address the user's browser uses to reach the backend (avatars are loaded by the browser,
+# not by this server), for deployments where it differs from BACKEND_URL
+PUBLIC_BACKEND_URL = os.environ.get("PUBLIC_BACKEND_URL", BACKEND_URL)
+RESIDENTS_PAGE_SIZE = 12
+MAX_TOUR_RESIDENTS = 500  # Upper bound of the backend's residents page size
 
 st.set_page_config(page_title="Rick & Morty AI Explorer", layout="wide")
 
+# Every user's requests reach the backend from this server, so tag them with a per-session id
+# that the backend's rate limiter keys on (otherwise all users would share one budget).
+# The id is signed with CLIENT_ID_SECRET, shared with the backend, so callers can't forge one.
+CLIENT_ID_SECRET = os.environ.get("CLIENT_ID_SECRET", "")
+if "client_id" not in st.session_state:
+    st.session_state.client_id = uuid.uuid4().hex
+CLIENT_HEADERS = {
+    "X-Client-Id": st.session_state.client_id,
+    "X-Client-Signature": hmac.new(
+        CLIENT_ID_SECRET.encode(), st.session_state.client_id.encode(), hashlib.sha256
+    ).hexdigest(),
+}
+
 st.title("🧪 Rick & Morty AI Explorer")
 
 # Sidebar for status
@@ -15,7 +37,7 @@ st.sidebar.header("System Status")
 
 async def check_backend_status():
     try:
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(headers=CLIENT_HEADERS) as client:
             response = await client.get(f"{BACKEND_URL}/health")
             if response.status_code == 200:
                 return True, response.json()
@@ -39,35 +61,70 @@ else:
     st.sidebar.error("Backend Disconnected ❌")
     st.stop()
 
+async def check_backend_ready():
+    try:
+        async with httpx.AsyncClient(headers=CLIENT_HEADERS) as client:
+            response = await client.get(f"{BACKEND_URL}/ready")
+            return response.json()
+    except Exception:
+        return None
+
+readiness = loop.run_until_complete(check_backend_ready())
+if readiness and readiness.get("status") != "ready":
+    index_status = readiness.get("checks", {}).get("vector_store", {}).get("status", "unknown")
+    st.sidebar.warning(f"Search index not ready ({index_status}) ⏳")
+
 # --- Phase 2: Data & Interaction ---
 
+def image_url(character_id):
+    # Served as cached WebP thumbnails by the backend instead of hotlinking the CDN
+    return f"{PUBLIC_BACKEND_URL}/images/{character_id}"
+
 async def get_locations(page=1):
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(headers=CLIENT_HEADERS) as client:
         resp = await client.get(f"{BACKEND_URL}/locations", params={"page": page})
+        if resp.status_code != 200:
+            st.error(f"Could not load locations: {resp.json().get('detail', resp.status_code)}")
+            return []
+        return resp.json()
+
+async def get_location_residents(location_id, offset=0, limit=RESIDENTS_PAGE_SIZE, fields="full"):
+    async with httpx.AsyncClient(headers=CLIENT_HEADERS) as client:
+        resp = await client.get(
+            f"{BACKEND_URL}/locations/{location_id}/residents",
+            params={"offset": offset, "limit": limit, "fields": fields},
+        )
+        if resp.status_code != 200:
+            st.warning(f"Could not load residents: {resp.json().get('detail', resp.status_code)}")
+            return {}
         return resp.json()
 
 async def get_notes(character_id):
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(headers=CLIENT_HEADERS) as client:
         resp = await client.get(f"{BACKEND_URL}/notes/{character_id}")
         return resp.json()
 
 async def get_notes_bulk(character_ids):
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(headers=CLIENT_HEADERS) as client:
         resp = await client.post(f"{BACKEND_URL}/notes/bulk", json=character_ids)
         return resp.json()
 
 async def add_note(character_id, content):
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(headers=CLIENT_HEADERS) as client:
         await client.post(f"{BACKEND_URL}/notes", json={"character_id": character_id, "content": content})
 
 async def generate_summary_stream(name, type, residents):
     # Increased timeout to 60 seconds to accommodate multiple LLM calls (generation + evaluation)
-    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, read=None)) as client:
+    async with httpx.AsyncClient(headers=CLIENT_HEADERS, timeout=httpx.Timeout(60.0, read=None)) as client:
         async with client.stream("POST", f"{BACKEND_URL}/generate-summary", json={
             "name": name,
             "type": type,
             "residents": residents
         }) as response:
+            if response.status_code in (429, 503):
+                await response.aread()
+                yield f"⚠️ {response.json().get('detail', 'The narrator is busy')}. Try again in a few seconds."
+                return
             async for chunk in response.aiter_text():
                 yield chunk
 
@@ -82,30 +139,23 @@ with tab1:
 
     locations = loop.run_until_complete(get_locations(page))
 
-    # --- OPTIMIZATION START ---
-    # 1. Collect all resident IDs first
-    all_resident_ids = []
-    if locations:
-        for loc in locations:
-            for res in loc.get("residents", []):
-                all_resident_ids.append(res['id'])
-
-    # 2. Fetch all notes in ONE request
-    notes_map = {}
-    if all_resident_ids:
-        notes_map = loop.run_until_complete(get_notes_bulk(all_resident_ids))
-    # --- OPTIMIZATION END ---
-
     if not locations:
         st.warning("No locations found.")
     else:
         for loc in locations:
-            with st.expander(f"{loc['name']} ({loc['type']})"):
+            resident_count = loc.get("resident_count", 0)
+            with st.expander(f"{loc['name']} ({loc['type']}) · {resident_count} residents"):
                 st.write(f"**Dimension:** {loc['dimension']}")
                 
                 # AI Summary Section
                 if st.button(f"😎 Tour this Location", key=f"ai_{loc['id']}"):
                     with st.spinner("Rick is thinking... (or drinking)"):
+                        # The page payload only carries counts, so fetch the names the narrator needs
+                        tour_residents = []
+                        if resident_count:
+                            tour_page = loop.run_until_complete(get_location_residents(loc['id'], 0, min(resident_count, MAX_TOUR_RESIDENTS), fields="names"))
+                            tour_residents = tour_page.get("residents", [])
+
                         st.markdown("### 🗣️ Narrator's Take")
                         summary_placeholder = st.empty()
                         # Use a mutable container to avoid scoping issues
@@ -114,7 +164,7 @@ with tab1:
                         # Consume the stream
                         async def run_stream():
                             accumulated = ""
-                            async for chunk in generate_summary_stream(loc['name'], loc['type'], loc['residents']):
+                            async for chunk in generate_summary_stream(loc['name'], loc['type'], tour_residents):
                                 accumulated += chunk
                                 if "|||" in accumulated:
                                     parts = accumulated.split("|||")
@@ -137,13 +187,27 @@ with tab1:
                             col_score.metric("Consistency Score", f"{state['evaluation_data']['score']}/10")
                             col_reason.write(f"**Reasoning:** {state['evaluation_data']['reasoning']}")
                 
-                residents = loc.get("residents", [])
-                if residents:
+                if not resident_count:
+                    st.info("No residents listed.")
+                # Streamlit runs expander bodies even when collapsed, so residents are only
+                # fetched (one page at a time) once the user asks for them.
+                elif st.toggle("Show residents", key=f"show_res_{loc['id']}"):
+                    offset_key = f"res_offset_{loc['id']}"
+                    offset = st.session_state.get(offset_key, 0)
+                    resident_page = loop.run_until_complete(get_location_residents(loc['id'], offset))
+                    residents = resident_page.get("residents", [])
+                    total = resident_page.get("total", resident_count)
+
+                    # Fetch notes for just this page of residents in ONE request
+                    notes_map = {}
+                    if residents:
+                        notes_map = loop.run_until_complete(get_notes_bulk([r['id'] for r in residents]))
+
                     st.subheader("Residents")
                     cols = st.columns(3)
                     for idx, res in enumerate(residents):
                         with cols[idx % 3]:
-                            st.image(res['image'], width=100)
+                            st.image(image_url(res['id']), width=100)
                             st.write(f"**{res['name']}**")
                             st.caption(f"{res['status']} - {res['species']}")
                             
@@ -165,8 +229,16 @@ with tab1:
                                         loop.run_until_complete(add_note(res['id'], new_note))
                                         st.success("Saved!")
                                         st.rerun()
-                else:
-                    st.info("No residents listed.")
+
+                    # Resident pagination
+                    col_prev, col_info, col_next = st.columns([1, 2, 1])
+                    if col_prev.button("◀ Prev", key=f"res_prev_{loc['id']}", disabled=offset == 0):
+                        st.session_state[offset_key] = max(0, offset - RESIDENTS_PAGE_SIZE)
+                        st.rerun()
+                    col_info.caption(f"Showing {offset + 1}–{offset + len(residents)} of {total}")
+                    if col_next.button("Next ▶", key=f"res_next_{loc['id']}", disabled=offset + RESIDENTS_PAGE_SIZE >= total):
+                        st.session_state[offset_key] = offset + RESIDENTS_PAGE_SIZE
+                        st.rerun()
 
 with tab2:
     st.header("🔍 Semantic Search")
@@ -179,13 +251,15 @@ with tab2:
             with st.spinner("Searching the multiverse..."):
                 async def perform_search():
                     # Increased timeout to 30s for embedding generation and index search
-                    async with httpx.AsyncClient(timeout=30.0) as client:
-                        resp = await client.post(f"{BACKEND_URL}/search", json={"query": query})
-                        return resp.json()
-                
-                results = loop.run_until_complete(perform_search())
+                    async with httpx.AsyncClient(headers=CLIENT_HEADERS, timeout=30.0) as client:
+                        resp = await client.post(f"{BACKEND_URL}/search", json={"query": query, "include_raw_matches": False})
+                        return resp.status_code, resp.json()
                 
-                results = loop.run_until_complete(perform_search())
+                status_code, results = loop.run_until_complete(perform_search())
+                if status_code in (429, 503):
+                    # Index still warming up, or the backend is shedding load
+                    st.warning(f"{results.get('detail', 'Search is unavailable')}. Try again in a few seconds.")
+                    st.stop()
                 
                 found_chars = results.get("characters", [])
                 found_locs = results.get("locations", [])
@@ -213,7 +287,7 @@ with tab2:
                         cols = st.columns(3)
                         for idx, res in enumerate(found_chars):
                             with cols[idx % 3]:
-                                st.image(res['image'], width=100)
+                                st.image(image_url(res['id']), width=100)
                                 st.write(f"**{res['name']}**")
                                 st.caption(f"{res['status']} - {res['species']}")
                                 
@@ -279,7 +353,7 @@ with tab2:
                                     r_cols = st.columns(3)
                                     for r_idx, res in enumerate(residents):
                                         with r_cols[r_idx % 3]:
-                                            st.image(res['image'], width=80)
+                                            st.image(image_url(res['id']), width=80)
                                             st.caption(f"{res['name']}")
                                 else:
                                     st.info("No residents listed.")
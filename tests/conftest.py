@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The backend runs from backend/ with flat imports, and the fakes live in bench/
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "backend"))
+sys.path.insert(0, os.path.join(REPO_DIR, "bench"))
@@ -0,0 +1,129 @@
+"""Client identification and rate limiting in AdmissionControlMiddleware."""
+import asyncio
+import pytest
+
+import admission
+from admission import AdmissionControlMiddleware, sign_client_id
+
+SECRET = "test-secret"
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(admission, "CLIENT_ID_SECRET", SECRET)
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {"127.0.0.1", "10.0.0.1"})
+    # /search costs 2 tokens, so each client gets two searches
+    monkeypatch.setattr(admission, "CLIENT_BURST", 4)
+    monkeypatch.setattr(admission, "CLIENT_RATE", 0.001)
+
+
+def scope(peer="127.0.0.1", path="/search", **headers):
+    return {
+        "type": "http",
+        "path": path,
+        "client": (peer, 50000),
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    }
+
+
+def signed(client_id, secret=SECRET):
+    return {"x_client_id": client_id, "x_client_signature": sign_client_id(client_id, secret)}
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def statuses(middleware, scopes):
+    async def call(s):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(s, None, send)
+        return sent[0]["status"]
+
+    async def run():
+        return [await call(s) for s in scopes]
+
+    return asyncio.run(run())
+
+
+# --- Client identity ---
+
+def test_socket_ip_without_trusted_headers():
+    mw = AdmissionControlMiddleware(ok_app)
+    assert mw._client_id(scope("203.0.113.5")) == "203.0.113.5"
+
+
+def test_forwarded_for_is_ignored_from_untrusted_peers():
+    mw = AdmissionControlMiddleware(ok_app)
+    assert mw._client_id(scope("203.0.113.5", x_forwarded_for="198.51.100.7")) == "203.0.113.5"
+
+
+def test_rightmost_untrusted_forwarded_hop_is_the_client():
+    mw = AdmissionControlMiddleware(ok_app)
+    # The client forged the leftmost entry; the trusted proxy appended the real address
+    s = scope(x_forwarded_for="1.2.3.4, 198.51.100.7, 10.0.0.1")
+    assert mw._client_id(s) == "198.51.100.7"
+
+
+def test_signed_session_id_is_used():
+    mw = AdmissionControlMiddleware(ok_app)
+    assert mw._client_id(scope(**signed("abc"))) == "session:abc"
+
+
+@pytest.mark.parametrize("headers", [
+    {"x_client_id": "abc"},
+    {"x_client_id": "abc", "x_client_signature": "deadbeef"},
+    signed("abc", secret="wrong-secret"),
+])
+def test_unsigned_or_badly_signed_session_id_is_ignored(headers):
+    mw = AdmissionControlMiddleware(ok_app)
+    assert mw._client_id(scope(**headers)) == "127.0.0.1"
+
+
+def test_session_ids_are_ignored_without_a_secret(monkeypatch):
+    monkeypatch.setattr(admission, "CLIENT_ID_SECRET", "")
+    mw = AdmissionControlMiddleware(ok_app)
+    assert mw._client_id(scope(**signed("abc", secret=""))) == "127.0.0.1"
+
+
+def test_forwarded_for_takes_precedence_over_session_id():
+    mw = AdmissionControlMiddleware(ok_app)
+    s = scope(x_forwarded_for="198.51.100.7", **signed("abc"))
+    assert mw._client_id(s) == "198.51.100.7"
+
+
+# --- Buckets ---
+
+def test_spoofed_headers_do_not_get_fresh_buckets():
+    mw = AdmissionControlMiddleware(ok_app)
+    spoofed = [
+        scope("203.0.113.5", x_forwarded_for="1.1.1.1"),
+        scope("203.0.113.5", x_client_id="a"),
+        scope(x_forwarded_for="2.2.2.2, 198.51.100.7"),
+        scope(x_forwarded_for="3.3.3.3, 198.51.100.7", x_client_id="b", x_client_signature="forged"),
+    ]
+    # Pairs from the same real client: 203.0.113.5 directly, then 198.51.100.7 via the proxy
+    assert statuses(mw, spoofed) == [200, 200, 200, 200]
+    assert statuses(mw, [scope("203.0.113.5", x_forwarded_for="4.4.4.4")]) == [429]
+    assert statuses(mw, [scope(x_forwarded_for="5.5.5.5, 198.51.100.7")]) == [429]
+    assert set(mw.client_buckets) == {"203.0.113.5", "198.51.100.7"}
+
+
+def test_each_signed_session_gets_its_own_bucket():
+    mw = AdmissionControlMiddleware(ok_app)
+    assert statuses(mw, [scope(**signed("alice"))] * 3) == [200, 200, 429]
+    assert statuses(mw, [scope(**signed("bob"))]) == [200]
+
+
+def test_shed_requests_get_their_tokens_back(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_QUEUE_WAIT", 0.0)
+    mw = AdmissionControlMiddleware(ok_app)
+    gate = mw._gate("/search")
+    gate.in_flight = gate.limit  # Every slot busy: new arrivals are shed right away
+    assert statuses(mw, [scope(**signed("carol"))] * 3) == [503, 503, 503]
+    assert mw.client_buckets["session:carol"].tokens == pytest.approx(admission.CLIENT_BURST, abs=0.01)
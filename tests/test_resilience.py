@@ -0,0 +1,221 @@
+"""Breaker, hedging, deadline and serve-stale behaviour of graphql_query, against the fake API.
+
+The fake GraphQL server runs in-process (httpx ASGITransport), with faults set on its FAULTS dict.
+
+    python -m pytest tests
+"""
+import time
+import asyncio
+from collections import OrderedDict
+import httpx
+import pytest
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+
+import fake_graphql
+import resilience
+from resilience import (
+    CircuitBreaker, StaleResponseMiddleware, UpstreamUnavailable, graphql_query, is_stale,
+    upstream_unavailable_handler, BREAKER_FAILURE_THRESHOLD, HEDGE_MIN_SAMPLES,
+)
+
+LOCATION_QUERY = "query ($id: ID!) { location(id: $id) { id name } }"
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fresh breaker/latency/stale state, wired to the in-process fake. Returns the list of upstream calls."""
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "_latencies", {})
+    monkeypatch.setattr(resilience, "_last_good", OrderedDict())
+    monkeypatch.setattr(
+        resilience, "_client", httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_graphql.app))
+    )
+    faults = {"latency_ms": 0, "jitter_ms": 0, "error_rate": 0, "hang_rate": 0, "hang_ms": 5000}
+    for name, value in faults.items():
+        monkeypatch.setitem(fake_graphql.FAULTS, name, value)
+
+    calls = []
+    post = resilience._post
+
+    async def counting_post(query, variables):
+        calls.append(variables)
+        return await post(query, variables)
+
+    monkeypatch.setattr(resilience, "_post", counting_post)
+    return calls
+
+
+def query_location(location_id="1", **kwargs):
+    return asyncio.run(graphql_query("location", LOCATION_QUERY, {"id": location_id}, **kwargs))
+
+
+def make_app():
+    """A minimal app with the same stale/503 wiring as main.py."""
+    app = FastAPI()
+    app.add_middleware(StaleResponseMiddleware)
+    app.add_exception_handler(UpstreamUnavailable, upstream_unavailable_handler)
+
+    @app.get("/locations/{location_id}")
+    async def location(location_id: str):
+        return await graphql_query("location", LOCATION_QUERY, {"id": location_id})
+
+    return app
+
+
+def get(app, path):
+    async def request():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path)
+    return asyncio.run(request())
+
+
+def hedged_count(operation):
+    return REGISTRY.get_sample_value("graphql_hedged_requests_total", {"operation": operation}) or 0
+
+
+# --- Circuit breaker ---
+
+def test_breaker_lets_a_single_probe_through_when_half_open():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_circuit_opens_at_threshold_and_stops_calling_upstream(upstream):
+    fake_graphql.FAULTS["error_rate"] = 1.0
+    for _ in range(BREAKER_FAILURE_THRESHOLD - 1):
+        with pytest.raises(UpstreamUnavailable):
+            query_location()
+    assert resilience.breaker_states() == {"location": "closed"}
+
+    with pytest.raises(UpstreamUnavailable):
+        query_location()
+    assert resilience.breaker_states() == {"location": "open"}
+    assert len(upstream) == BREAKER_FAILURE_THRESHOLD
+
+    # Open circuit: fail fast without touching the (now healthy) upstream
+    fake_graphql.FAULTS["error_rate"] = 0.0
+    with pytest.raises(UpstreamUnavailable):
+        query_location()
+    assert len(upstream) == BREAKER_FAILURE_THRESHOLD
+
+
+def test_cancelled_half_open_probe_is_released(upstream):
+    breaker = resilience._breakers["location"] = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    fake_graphql.FAULTS["hang_rate"] = 1.0
+
+    async def scenario():
+        probe = asyncio.create_task(graphql_query("location", LOCATION_QUERY, {"id": "1"}))
+        await asyncio.sleep(0.1)
+        assert breaker.state == "half_open"
+        assert not breaker.allow()  # The probe is in flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(scenario())
+    assert breaker.allow()
+
+
+# --- Deadline and hedging ---
+
+def test_deadline_bounds_a_hanging_call(upstream):
+    fake_graphql.FAULTS["hang_rate"] = 1.0
+    start = time.monotonic()
+    with pytest.raises(UpstreamUnavailable):
+        query_location(deadline=0.2)
+    assert time.monotonic() - start < 1.0
+    assert resilience._breakers["location"].failures == 1
+
+
+def test_hedge_is_sent_when_the_first_request_hangs(upstream, monkeypatch):
+    # Enough fast calls for a p95 to hedge at
+    for _ in range(HEDGE_MIN_SAMPLES):
+        query_location()
+    before = hedged_count("location")
+
+    attempts = []
+    post = resilience._post
+
+    async def first_attempt_hangs(query, variables):
+        fake_graphql.FAULTS["hang_rate"] = 0.0 if attempts else 1.0
+        attempts.append(variables)
+        return await post(query, variables)
+
+    monkeypatch.setattr(resilience, "_post", first_attempt_hangs)
+    start = time.monotonic()
+    data = query_location()
+
+    assert data["location"]["id"] == "1"
+    assert len(attempts) == 2
+    assert hedged_count("location") == before + 1
+    assert time.monotonic() - start < 1.0
+
+
+def test_no_hedge_without_latency_history(upstream):
+    fake_graphql.FAULTS["hang_rate"] = 1.0
+    with pytest.raises(UpstreamUnavailable):
+        query_location(deadline=0.2)
+    assert len(upstream) == 1
+
+
+# --- Serve-stale ---
+
+def test_last_good_response_is_served_stale_with_warning(upstream):
+    app = make_app()
+    fresh = get(app, "/locations/1")
+    assert fresh.status_code == 200
+    assert "warning" not in fresh.headers
+
+    fake_graphql.FAULTS["error_rate"] = 1.0
+    stale = get(app, "/locations/1")
+    assert stale.status_code == 200
+    assert stale.json() == fresh.json()
+    assert stale.headers["warning"].startswith("110")
+    assert stale.headers["cache-control"] == "no-cache"
+
+
+def test_stale_is_served_while_the_circuit_is_open(upstream):
+    query_location()
+    fake_graphql.FAULTS["error_rate"] = 1.0
+    for _ in range(BREAKER_FAILURE_THRESHOLD):
+        query_location()
+    assert resilience.breaker_states() == {"location": "open"}
+
+    calls = len(upstream)
+    assert query_location()["location"]["id"] == "1"
+    assert len(upstream) == calls
+
+
+def test_unavailable_without_fallback_is_a_503(upstream):
+    fake_graphql.FAULTS["error_rate"] = 1.0
+    response = get(make_app(), "/locations/2")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(int(resilience.BREAKER_RESET_TIMEOUT))
+    assert "warning" not in response.headers
+
+
+def test_stale_flag_is_scoped_to_the_request():
+    assert not is_stale()
+    resilience.mark_stale()  # No request in progress: nothing to flag
+    assert not is_stale()